@@ -0,0 +1,326 @@
+'''
+contains benchmarks of parts of the simulation
+
+Run all benchmarks with: python benchmarks.py
+or a selection with: python benchmarks.py tstep startup
+
+Exits with an error if a check fails, such as the startup benchmark finding
+that importing the simulation without visualisation got slower.
+'''
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+def time_call(function, repeats=5):
+    '''returns the best time in seconds of calling function, over repeats'''
+    best = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_tstep(pop_sizes=[1000, 100000], steps=50):
+    '''times a simulation step
+
+    Keyword arguments
+    -----------------
+    pop_sizes : list
+        the population sizes to benchmark
+
+    steps : int
+        the number of simulation steps to time
+    '''
+    from simulation import Simulation
+
+    results = []
+    for pop_size in pop_sizes:
+        sim = Simulation(pop_size = pop_size, seed = 0, visualise = False, verbose = False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim.tstep() #first step sets up the index
+            seconds = time_call(lambda: [sim.tstep() for i in range(steps)], repeats = 1)
+        results.append({'benchmark': 'tstep', 'pop_size': pop_size,
+                        'variant': 'generator', 'us': 1e6 * seconds / steps})
+    return results
+
+
+def benchmark_ensemble(pop_sizes=[100, 500, 2000], replicas=20, steps=100):
+    '''compares running replicas one by one with running them as one ensemble
+
+    Keyword arguments
+    -----------------
+    pop_sizes : list
+        the population sizes of the replicas to benchmark
+
+    replicas : int
+        the number of replicas
+
+    steps : int
+        the number of simulation steps to time, starting at the infection
+        of patient zero
+    '''
+    from ensemble import Ensemble
+    from simulation import Simulation
+
+    def warm_up(sim):
+        #step until patient zero is infected, so infections are part of the timing
+        while sim.frame <= 50:
+            sim.tstep()
+        return sim
+
+    results = []
+    for pop_size in pop_sizes:
+        config = dict(pop_size = pop_size, visualise = False, verbose = False, report_freq = 0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            sims = [warm_up(Simulation(seed = r, **config)) for r in range(replicas)]
+            single = time_call(lambda: [sim.tstep() for sim in sims for i in range(steps)], 
+                               repeats = 1)
+
+            ensemble = warm_up(Ensemble(replicas, seed = 0, **config))
+            together = time_call(lambda: [ensemble.tstep() for i in range(steps)], repeats = 1)
+
+        #times are per step of a single replica
+        results.append({'benchmark': 'ensemble', 'pop_size': pop_size,
+                        'variant': 'single', 'us': 1e6 * single / (steps * replicas)})
+        results.append({'benchmark': 'ensemble', 'pop_size': pop_size,
+                        'variant': 'ensemble', 'us': 1e6 * together / (steps * replicas)})
+    return results
+
+
+def benchmark_random_source(pop_sizes=[100, 2000], replicas=50, steps=100):
+    '''compares drawing the random numbers of an ensemble in blocks with
+    calling the Generator of every replica for every draw
+
+    A single simulation makes about a dozen draws per step, vectorized over
+    the population, so its Generator is called directly. An ensemble draws
+    from a Generator per replica (see Replica_streams), which costs a call
+    per replica for every draw, unless the values are drawn in blocks.
+    Times ensemble steps, and as 'random_draw' single draws for 1% of
+    the members, such as the heading updates of a step.
+
+    Keyword arguments
+    -----------------
+    pop_sizes : list
+        the population sizes of the replicas to benchmark
+
+    replicas : int
+        the number of replicas
+
+    steps : int
+        the number of simulation steps to time, starting at the infection
+        of patient zero
+    '''
+    from ensemble import Ensemble
+    from utils import for_members
+
+    results = []
+    for pop_size in pop_sizes:
+        for variant, block_size in [('direct', 0), ('blocks', 4096)]:
+            ensemble = Ensemble(replicas, seed = 0, pop_size = pop_size, visualise = False,
+                                verbose = False, report_freq = 0, rng_block_size = block_size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(51):
+                    ensemble.tstep()
+                seconds = time_call(lambda: [ensemble.tstep() for i in range(steps)],
+                                    repeats = 1)
+
+            #times are per step of a single replica
+            results.append({'benchmark': 'random_source', 'pop_size': pop_size,
+                            'variant': variant, 'us': 1e6 * seconds / (steps * replicas)})
+
+            members = np.flatnonzero(np.arange(replicas * pop_size) % 100 == 0)
+            rng = ensemble.rng
+            seconds = time_call(lambda: [for_members(rng, members).normal(0, 1, len(members))
+                                         for i in range(1000)])
+            results.append({'benchmark': 'random_draw', 'pop_size': pop_size,
+                            'variant': variant, 'us': 1e6 * seconds / 1000})
+    return results
+
+
+def benchmark_step_n(pop_sizes=[100, 2000], steps=2000):
+    '''compares calling tstep() for every frame with advancing many frames with step_n()
+
+    Both run with lockdown set, whose check looks back over all frames so
+    far in tstep(), and without fast forwarding, so every frame is a full step.
+
+    Keyword arguments
+    -----------------
+    pop_sizes : list
+        the population sizes to benchmark
+
+    steps : int
+        the number of simulation steps to time, starting at the infection
+        of patient zero
+    '''
+    from simulation import Simulation
+
+    def warm_up(pop_size):
+        sim = Simulation(pop_size = pop_size, seed = 0, visualise = False, verbose = False,
+                         report_freq = 0)
+        sim.Config.set_lockdown(rng = sim.rng)
+        #step until patient zero is infected, so infections are part of the timing
+        while sim.frame <= 50:
+            sim.tstep()
+        return sim
+
+    results = []
+    for pop_size in pop_sizes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim = warm_up(pop_size)
+            single = time_call(lambda: [sim.tstep() for i in range(steps)], repeats = 1)
+
+            sim = warm_up(pop_size)
+            together = time_call(lambda: sim.step_n(steps), repeats = 1)
+
+        results.append({'benchmark': 'step_n', 'pop_size': pop_size,
+                        'variant': 'tstep', 'us': 1e6 * single / steps})
+        results.append({'benchmark': 'step_n', 'pop_size': pop_size,
+                        'variant': 'step_n', 'us': 1e6 * together / steps})
+    return results
+
+
+def benchmark_neighbours(pop_sizes=[2000, 20000], steps=300):
+    '''compares the 'grid' and 'verlet' neighbour methods
+
+    Times the population moving freely, where the verlet list falls back to
+    searching the grid, and in a lockdown everyone complies with, where the
+    list is built once and reused.
+
+    Keyword arguments
+    -----------------
+    pop_sizes : list
+        the population sizes to benchmark
+
+    steps : int
+        the number of simulation steps to time, starting at the infection
+        of patient zero
+    '''
+    from simulation import Simulation
+
+    def warm_up(pop_size, method, lockdown):
+        sim = Simulation(pop_size = pop_size, seed = 0, visualise = False, verbose = False,
+                         report_freq = 0, neighbour_method = method)
+        if lockdown:
+            sim.Config.set_lockdown(lockdown_percentage = 0, lockdown_compliance = 1,
+                                    rng = sim.rng)
+        #step until patient zero is infected, so infections are part of the timing
+        sim.step_n(51)
+        return sim
+
+    results = []
+    for lockdown in [False, True]:
+        for pop_size in pop_sizes:
+            for method in ['grid', 'verlet']:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    sim = warm_up(pop_size, method, lockdown)
+                    seconds = time_call(lambda: sim.step_n(steps), repeats = 1)
+
+                results.append({'benchmark': 'neighbours lock' if lockdown else 'neighbours',
+                                'pop_size': pop_size, 'variant': method,
+                                'us': 1e6 * seconds / steps})
+    return results
+
+
+def time_import(module, repeats=5, watch=[]):
+    '''times importing module in a fresh interpreter
+
+    Returns the best import time in seconds over repeats, and which of the
+    modules in watch got imported along with it.
+    '''
+    code = ('import sys, time\n'
+            'start = time.perf_counter()\n'
+            'import %s\n'
+            'print(time.perf_counter() - start)\n'
+            'print(",".join([m for m in %r if m in sys.modules]))' %(module, watch))
+
+    best = np.inf
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        seconds, imported = output.stdout.split('\n')[:2]
+        best = min(best, float(seconds))
+
+    return best, [m for m in imported.split(',') if m != '']
+
+
+def benchmark_startup(repeats=5, max_overhead=0.25, 
+                      forbidden=['matplotlib', 'scipy', 'numba', 'llvmlite']):
+    '''times importing the simulation for a run without visualisation
+
+    Fails if importing the simulation pulls in one of the forbidden modules,
+    or takes more than max_overhead seconds longer than importing numpy.
+
+    Keyword arguments
+    -----------------
+    repeats : int
+        the number of imports to take the best time of
+
+    max_overhead : float
+        the allowed import time on top of importing numpy, in seconds
+
+    forbidden : list
+        the modules that may not be imported when not visualising
+    '''
+    numpy_seconds, _ = time_import('numpy', repeats)
+    seconds, imported = time_import('simulation', repeats, forbidden)
+
+    if len(imported) > 0:
+        raise RuntimeError('importing simulation without visualisation imports %s'
+                           %', '.join(imported))
+    if seconds - numpy_seconds > max_overhead:
+        raise RuntimeError('importing simulation takes %.3fs, %.3fs more than numpy, allowed is %.3fs'
+                           %(seconds, seconds - numpy_seconds, max_overhead))
+
+    return [{'benchmark': 'startup', 'pop_size': 0, 'variant': 'numpy', 'us': 1e6 * numpy_seconds},
+            {'benchmark': 'startup', 'pop_size': 0, 'variant': 'simulation', 'us': 1e6 * seconds}]
+
+
+benchmarks = {'tstep': benchmark_tstep,
+              'ensemble': benchmark_ensemble,
+              'random_source': benchmark_random_source,
+              'step_n': benchmark_step_n,
+              'neighbours': benchmark_neighbours,
+              'startup': benchmark_startup}
+
+
+def run_benchmarks(names=None):
+    '''runs the benchmarks with the given names, or all if None, returns the results'''
+    if names is None:
+        names = list(benchmarks)
+
+    results = []
+    for name in names:
+        if name not in benchmarks:
+            raise ValueError('benchmark %s not understood! Must be one of %s'
+                             %(name, ', '.join(benchmarks)))
+        results += benchmarks[name]()
+    return results
+
+
+def report(results):
+    '''prints benchmark results as a table
+
+    Times are per simulation step (of a single replica for the ensemble
+    and random_source benchmarks), per draw for random_draw, or per import
+    for the startup benchmark.
+    '''
+    print('%-16s %10s %-10s %14s' %('benchmark', 'pop_size', 'variant', 'microseconds'))
+    for result in results:
+        print('%-16s %10i %-10s %14.1f' %(result['benchmark'], result['pop_size'],
+                                          result['variant'], result['us']))
+
+
+if __name__ == '__main__':
+    try:
+        report(run_benchmarks(sys.argv[1:] or None))
+    except RuntimeError as error:
+        print('benchmark failed: %s' %error)
+        sys.exit(1)
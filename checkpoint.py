@@ -0,0 +1,263 @@
+'''
+contains functions to write the full state of a simulation to disk and
+read it back, so that a run can be interrupted and resumed
+'''
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from infection import Recovery_calendar
+from locations import Location_registry
+from neighbours import Verlet_list
+from population import Population_columns, Population_trackers, State_index
+from schedules import Travel_schedule
+from utils import check_folder
+
+checkpoint_version = 1
+
+
+def pack_column(values):
+    '''returns values as the smallest integer type that holds them exactly
+
+    Columns that hold whole numbers only, such as states, ages and frames,
+    are stored as int8, int16 or int32. Other columns are returned as is.
+    '''
+    if values.dtype.kind != 'f' or len(values) == 0:
+        return values
+
+    low = values.min()
+    high = values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            packed = values.astype(dtype)
+            if np.array_equal(packed, values):
+                return packed
+            break
+
+    return values
+
+
+def _encode(value):
+    '''converts values json can not handle, used as json default'''
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.random.SeedSequence):
+        return {'__seed_sequence__': {'entropy': value.entropy,
+                                      'spawn_key': list(value.spawn_key),
+                                      'pool_size': value.pool_size}}
+    raise TypeError('value %r can not be stored in a checkpoint' %(value,))
+
+
+def _decode(value):
+    '''restores values converted by _encode(), used as json object hook'''
+    if '__ndarray__' in value:
+        return np.array(value['__ndarray__'], dtype=value['dtype'])
+    if '__seed_sequence__' in value:
+        seed = value['__seed_sequence__']
+        return np.random.SeedSequence(seed['entropy'], spawn_key=seed['spawn_key'],
+                                      pool_size=seed['pool_size'])
+    return value
+
+
+def get_rng_state(rng, arrays):
+    '''returns the state of a random number generator
+
+    Large arrays of the state are added to arrays, the rest is returned
+    as dictionary that can be stored as json.
+
+    Keyword arguments
+    -----------------
+    rng : Generator or np.random
+        the random number generator of the simulation
+
+    arrays : dict
+        the arrays to write to the checkpoint
+    '''
+    if isinstance(rng, np.random.Generator):
+        return {'kind': 'generator', 'state': rng.bit_generator.state}
+
+    #global numpy random state
+    name, keys, position, has_gauss, cached_gaussian = rng.get_state()
+    arrays['rng_keys'] = keys
+    return {'kind': 'global', 'name': name, 'position': position,
+            'has_gauss': has_gauss, 'cached_gaussian': cached_gaussian}
+
+
+def set_rng_state(state, arrays):
+    '''returns the random number generator stored by get_rng_state()
+
+    The global numpy random state is set in place, and returned as np.random.
+    '''
+    if state['kind'] == 'generator':
+        bit_generator = getattr(np.random, state['state']['bit_generator'])()
+        bit_generator.state = state['state']
+        return np.random.Generator(bit_generator)
+
+    np.random.set_state((state['name'], arrays['rng_keys'], state['position'],
+                         state['has_gauss'], state['cached_gaussian']))
+    return np.random
+
+
+def write_arrays(path, arrays):
+    '''writes arrays to an uncompressed .npz file, atomically
+
+    The file is written under a temporary name in the same folder, synced
+    to disk and then renamed to path, so path either holds the previous
+    file or the complete new one, even if writing fails halfway.
+    '''
+    folder = os.path.dirname(os.path.abspath(path))
+    check_folder(folder)
+
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix='.checkpoint_', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def save_checkpoint(sim, path):
+    '''writes the state of a simulation to path
+
+    Stores the population, destinations, frame, population trackers,
+    configuration, random number generator state and travel schedule.
+    The recovery calendar, state index and neighbour list follow from
+    the population and are rebuilt by load_checkpoint(). A run resumed from
+    a checkpoint takes the same steps as the uninterrupted run, except with
+    engine 'numba', whose random state is not stored.
+
+    Keyword arguments
+    -----------------
+    sim : Simulation
+        the simulation to store
+
+    path : str
+        the file to write to, replaced atomically if it exists
+    '''
+    arrays = {}
+    meta = {'version': checkpoint_version, 'frame': sim.frame}
+
+    #population, row index equals id, so the id column is only stored if it differs
+    population = sim.population
+    meta['pop_size'] = len(population)
+    for column in range(population.shape[1]):
+        #contiguous copy, which is also what gets written
+        values = np.ascontiguousarray(population[:,column])
+        if column == 0 and np.array_equal(values, np.arange(len(population))):
+            continue
+        arrays['population_%i' %column] = pack_column(values)
+
+    if isinstance(sim.destinations, Location_registry):
+        meta['destinations'] = 'registry'
+        arrays['location_bounds'] = sim.destinations.bounds
+        arrays['location_ids'] = sim.destinations.ids
+    else:
+        meta['destinations'] = 'matrix'
+        arrays['destinations'] = np.asarray(sim.destinations)
+
+    for name in ('susceptible', 'infectious', 'recovered', 'fatalities'):
+        arrays['tracker_' + name] = np.asarray(getattr(sim.pop_tracker, name), dtype=np.int64)
+    meta['reinfect'] = sim.pop_tracker.reinfect
+
+    #configuration, with arrays such as the lockdown vector stored separately
+    config = {}
+    for key, value in sim.Config.__dict__.items():
+        if key.startswith('_'):
+            continue
+        if isinstance(value, np.ndarray):
+            arrays['config_' + key] = value
+        else:
+            config[key] = value
+    meta['config'] = config
+
+    meta['rng'] = get_rng_state(sim.rng, arrays)
+
+    if sim.schedule is not None:
+        meta['day_length'] = sim.schedule.day_length
+        arrays['schedule_members'] = sim.schedule.members
+        arrays['schedule_starts'] = sim.schedule.starts
+        arrays['schedule_dest_nos'] = sim.schedule.dest_nos
+        arrays['schedule_wander_ranges'] = sim.schedule.wander_ranges
+
+    arrays['meta'] = np.array(json.dumps(meta, default=_encode))
+    write_arrays(path, arrays)
+
+
+def load_checkpoint(sim, path):
+    '''sets the state of a simulation to that stored in path
+
+    Keyword arguments
+    -----------------
+    sim : Simulation
+        the simulation to restore, its configuration is replaced by the stored one
+
+    path : str
+        the checkpoint file written by save_checkpoint()
+    '''
+    with np.load(path) as stored:
+        arrays = {key: stored[key] for key in stored.files}
+
+    meta = json.loads(str(arrays['meta']), object_hook=_decode)
+    if meta['version'] != checkpoint_version:
+        raise ValueError('checkpoint version %s not understood! Must be %i'
+                         %(meta['version'], checkpoint_version))
+
+    for key, value in meta['config'].items():
+        sim.Config.set(key, value)
+    for key in arrays:
+        if key.startswith('config_'):
+            sim.Config.set(key[len('config_'):], arrays[key])
+
+    sim.frame = meta['frame']
+    sim.rng = set_rng_state(meta['rng'], arrays)
+
+    population = np.zeros((meta['pop_size'], 15))
+    population[:,0] = np.arange(meta['pop_size'])
+    for column in range(15):
+        if 'population_%i' %column in arrays:
+            population[:,column] = arrays['population_%i' %column]
+
+    if sim.Config.population_layout == 'columns':
+        population = Population_columns.from_matrix(population, sim.Config.float_dtype)
+    sim.population = population
+    sim.state_index = State_index(population)
+
+    if meta['destinations'] == 'registry':
+        sim.destinations = Location_registry(len(arrays['location_ids']),
+                                             arrays['location_ids'].shape[1])
+        for bounds in arrays['location_bounds']:
+            sim.destinations.add(bounds)
+        sim.destinations.ids = arrays['location_ids']
+    else:
+        sim.destinations = arrays['destinations']
+
+    sim.pop_tracker = Population_trackers()
+    for name in ('susceptible', 'infectious', 'recovered', 'fatalities'):
+        setattr(sim.pop_tracker, name, arrays['tracker_' + name].tolist())
+    sim.pop_tracker.reinfect = meta['reinfect']
+
+    #everyone still infected is due to resolve at a frame that follows from the population
+    sim.calendar = Recovery_calendar()
+    sim.calendar.schedule(population, sim.state_index.get(6, 1), sim.Config)
+
+    #the pairs found do not depend on when the neighbour list is built
+    sim.neighbour_list = Verlet_list(sim.Config.verlet_skin)
+
+    if 'schedule_members' in arrays:
+        sim.schedule = Travel_schedule(meta['day_length'])
+        sim.schedule.members = arrays['schedule_members']
+        sim.schedule.starts = arrays['schedule_starts']
+        sim.schedule.dest_nos = arrays['schedule_dest_nos']
+        sim.schedule.wander_ranges = arrays['schedule_wander_ranges']
+    else:
+        sim.schedule = None
@@ -0,0 +1,193 @@
+'''
+command line interface to run the simulation without visualisation
+
+Usage:
+    python -m cli run [--steps n] [--scenario name] [--seed n] [--set key=value ...]
+    python -m cli sweep --grid key=value,value,... [--replicas n] [--workers n] [--ensemble] [--output folder] ...
+    python -m cli study name [--replicas n] [--workers n] [--ensemble] [--output folder] ...
+    python -m cli branch --branch scenario=lockdown lockdown_percentage=0.05 --branch ... [--warmup n] ...
+    python -m cli bench [name ...]
+
+Configuration values are parsed as Python literals where possible, so
+--set pop_size=5000 sets an int and --set recovery_duration=(100,300) a tuple.
+Results are written to stdout as JSON. With --output, a sweep also writes the
+curves and summary CSV in the layout of the studies in data/, see save_sweep().
+'''
+
+import argparse
+import ast
+import json
+import sys
+
+def parse_value(text):
+    '''parses a value as Python literal, or returns it as string'''
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def parse_settings(settings):
+    '''parses a list of 'key=value' strings into a dictionary'''
+    config = {}
+    for setting in settings:
+        if '=' not in setting:
+            raise argparse.ArgumentTypeError('setting %s not understood! Must be key=value'
+                                             %setting)
+        key, value = setting.split('=', 1)
+        config[key.strip()] = parse_value(value)
+    return config
+
+
+def parse_grid(items):
+    '''parses a list of 'key=value,value,...' strings into a grid dictionary'''
+    grid = {}
+    for item in items:
+        if '=' not in item:
+            raise argparse.ArgumentTypeError('grid %s not understood! Must be key=value,value,...'
+                                             %item)
+        key, values = item.split('=', 1)
+        try:
+            grid[key.strip()] = list(ast.literal_eval('[%s]' %values))
+        except (ValueError, SyntaxError):
+            grid[key.strip()] = [value.strip() for value in values.split(',')]
+    return grid
+
+
+def build_parser():
+    '''returns the parser of the command line arguments'''
+    from sweep import density_studies, scenarios
+
+    parser = argparse.ArgumentParser(prog='python -m cli',
+                                     description='run the infection simulation without visualisation')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    def add_simulation_arguments(command):
+        command.add_argument('--set', nargs='+', default=[], metavar='KEY=VALUE',
+                             help='Configuration values to set')
+        command.add_argument('--steps', type=int, default=None,
+                             help='the maximum number of simulation steps')
+        command.add_argument('--scenario', choices=scenarios, default='none',
+                             help='the scenario to simulate')
+        command.add_argument('--seed', type=int, default=None,
+                             help='seed of the random number generator')
+
+    run = commands.add_parser('run', help='run one simulation')
+    add_simulation_arguments(run)
+
+    sweep = commands.add_parser('sweep', help='run a grid of simulations in parallel')
+    add_simulation_arguments(sweep)
+    sweep.add_argument('--grid', nargs='+', required=True, metavar='KEY=VALUE,VALUE',
+                       help='Configuration values to sweep over')
+    sweep.add_argument('--replicas', type=int, default=1,
+                       help='the number of runs per combination of values')
+    sweep.add_argument('--workers', type=int, default=None,
+                       help='the number of worker processes, defaults to the number of processors')
+    sweep.add_argument('--ensemble', action='store_true',
+                       help='run the replicas of each combination together in one array')
+    sweep.add_argument('--output', default=None, metavar='FOLDER',
+                       help='the folder to write the curves to, the summary goes to FOLDER.csv')
+
+    study = commands.add_parser('study', help='rerun one of the self-isolation studies in data/')
+    study.add_argument('name', choices=list(density_studies), help='the study to run')
+    study.add_argument('--set', nargs='+', default=[], metavar='KEY=VALUE',
+                       help='Configuration values to change from those of the study')
+    study.add_argument('--seed', type=int, default=None,
+                       help='seed of the random number generator')
+    study.add_argument('--replicas', type=int, default=100,
+                       help='the number of runs per proportion of people that comply')
+    study.add_argument('--workers', type=int, default=None,
+                       help='the number of worker processes, defaults to the number of processors')
+    study.add_argument('--ensemble', action='store_true',
+                       help='run the replicas of each proportion together in one array')
+    study.add_argument('--output', default=None, metavar='FOLDER',
+                       help='the folder to write the curves to, defaults to results/<name>, '
+                            'data/<name> replaces the study in data/')
+
+    branch = commands.add_parser('branch', help='run scenarios branched from a shared warm-up')
+    add_simulation_arguments(branch)
+    branch.add_argument('--branch', nargs='+', action='append', required=True, metavar='KEY=VALUE',
+                        help='Configuration values of a branch, with the scenario as scenario=name')
+    branch.add_argument('--warmup', type=int, default=51,
+                        help='the number of frames to run before branching')
+    branch.add_argument('--replicas', type=int, default=1,
+                        help='the number of runs per branch')
+    branch.add_argument('--workers', type=int, default=None,
+                        help='the number of processes running at once, defaults to the number of processors')
+    branch.add_argument('--output', default=None, metavar='FOLDER',
+                        help='the folder to write the curves to, the summary goes to FOLDER.csv')
+
+    bench = commands.add_parser('bench', help='run the benchmarks')
+    bench.add_argument('names', nargs='*', help='the benchmarks to run, all if none given')
+
+    return parser
+
+
+def main(argv=None):
+    '''runs the command given on the command line, returns the exit code'''
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        from benchmarks import benchmarks, run_benchmarks
+        #checked here, argparse choices reject the empty list of nargs='*'
+        unknown = [name for name in args.names if name not in benchmarks]
+        if len(unknown) > 0:
+            parser.error('unknown benchmarks %s, choose from %s'
+                         %(', '.join(unknown), ', '.join(benchmarks)))
+        try:
+            output = run_benchmarks(args.names or None)
+        except (RuntimeError, ValueError) as error:
+            print(json.dumps({'error': str(error)}))
+            return 1
+    else:
+        try:
+            config = parse_settings(args.set)
+            if getattr(args, 'steps', None) is not None:
+                config['simulation_steps'] = args.steps
+        except argparse.ArgumentTypeError as error:
+            parser.error(str(error))
+
+        if args.command == 'run':
+            from sweep import run_simulation
+            if args.seed is not None:
+                config['seed'] = args.seed
+            output = run_simulation(config, args.scenario)
+        elif args.command == 'branch':
+            from sweep import run_branches, save_sweep
+            try:
+                branches = [parse_settings(settings) for settings in args.branch]
+            except argparse.ArgumentTypeError as error:
+                parser.error(str(error))
+            output = run_branches(branches, config, args.scenario, args.warmup, args.replicas,
+                                  args.workers, args.seed, curves = args.output is not None)
+            if args.output is not None:
+                save_sweep(output, args.output)
+        elif args.command == 'study':
+            from sweep import run_density_study
+            output = run_density_study(args.name, args.replicas, args.workers, args.seed,
+                                       args.output, config, args.ensemble)
+        else:
+            from sweep import run_sweep, save_sweep
+            try:
+                grid = parse_grid(args.grid)
+            except argparse.ArgumentTypeError as error:
+                parser.error(str(error))
+            output = run_sweep(grid, config, args.scenario, args.replicas,
+                               args.workers, args.seed, curves = args.output is not None,
+                               ensemble = args.ensemble)
+            if args.output is not None:
+                save_sweep(output, args.output)
+
+        if args.command != 'run':
+            #the curves are on disk, keep the printed results to the summaries
+            for result in output:
+                result.pop('curves', None)
+
+    print(json.dumps(output, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,14 +12,25 @@ class Configuration():
     def __init__(self, *args, **kwargs):
         #simulation variables
         self.verbose = kwargs.get('verbose', True) #whether to print infections, recoveries and fatalities to the terminal
+        self.report_freq = kwargs.get('report_freq', 1) #status line is written to the terminal every 'n' timesteps, 0 to never write it
         self.simulation_steps = kwargs.get('simulation_steps', 10000) #total simulation steps performed
         self.tstep = kwargs.get('tstep', 0) #current simulation timestep
         self.save_data = kwargs.get('save_data', False) #whether to dump data at end of simulation
         self.save_pop = kwargs.get('save_pop', False) #whether to save population matrix every 'save_pop_freq' timesteps
         self.save_pop_freq = kwargs.get('save_pop_freq', 10) #population data will be saved every 'n' timesteps. Default: 10
         self.save_pop_folder = kwargs.get('save_pop_folder', 'pop_data/') #folder to write population timestep data to
+        self.checkpoint_path = kwargs.get('checkpoint_path', None) #file to write checkpoints of the full simulation state to, None to never write them
+        self.checkpoint_freq = kwargs.get('checkpoint_freq', 0) #a checkpoint is written every 'n' timesteps, 0 to only write one when CTRL-C is caught
         self.endif_no_infections = kwargs.get('endif_no_infections', True) #whether to stop simulation if no infections remain
+        self.fast_forward = kwargs.get('fast_forward', False) #whether run() only moves the population in frames where nobody is infectious
         self.world_size = kwargs.get('world_size', [2, 2]) #x and y sizes of the world
+        self.seed = kwargs.get('seed', None) #seed (int or numpy SeedSequence) of the random number generator, None uses the global numpy random state
+        self.rng_block_size = kwargs.get('rng_block_size', 4096) #random values drawn at once per replica of an Ensemble, 0 to draw them when needed
+        self.engine = kwargs.get('engine', 'numpy') #'numpy' or 'numba', numba compiles the heaviest computations if installed
+        self.population_layout = kwargs.get('population_layout', 'matrix') #'matrix' or 'columns', columns stores every column as its own compact array
+        self.float_dtype = kwargs.get('float_dtype', 'float64') #data type of positions, headings and speeds in the 'columns' layout, 'float64' or 'float32'
+        self.location_registry = kwargs.get('location_registry', False) #whether to store destinations in a shared location table in stead of a matrix per member
+        self.total_destinations = kwargs.get('total_destinations', 1) #number of destinations each member can have, e.g. 3 for home, work and groceries
 
 
         #scenario flags
@@ -75,6 +86,14 @@ class Configuration():
         self.infection_chance = kwargs.get('infection_chance', 0.03)   #chance that an infection spreads to nearby healthy people each tick
         self.recovery_duration = kwargs.get('recovery_duration', (200, 500)) #how many ticks it may take to recover from the illness
         self.mortality_chance = kwargs.get('mortality_chance', 0.02) #global baseline chance of dying from the disease
+        #method used to find people within infection range: 'brute', 'grid', 'kdtree' or 'verlet'
+        #'grid' works best for evenly spread populations, 'kdtree' for strongly clustered ones
+        #'verlet' reuses candidate pairs over multiple steps, for large slow-moving populations
+        self.neighbour_method = kwargs.get('neighbour_method', 'grid')
+        self.verlet_skin = kwargs.get('verlet_skin', None) #extra range kept in the 'verlet' candidate pairs, None to size it from how far people move
+        #whether to approximate the number of infected around healthy people once more than half is infected
+        self.density_approximation = kwargs.get('density_approximation', False)
+        self.density_resolution = kwargs.get('density_resolution', 4) #grid cells per infection zone side used in the approximation
 
         #healthcare variables
         self.healthcare_capacity = kwargs.get('healthcare_capacity', 300) #capacity of the healthcare system
@@ -138,8 +157,15 @@ class Configuration():
         pass
 
 
-    def set_lockdown(self, lockdown_percentage=0.1, lockdown_compliance=0.9):
-        '''sets lockdown to active'''
+    def set_lockdown(self, lockdown_percentage=0.1, lockdown_compliance=0.9, rng=None):
+        '''sets lockdown to active
+
+        Pass the random number generator of the simulation (Simulation.rng)
+        as rng to draw who complies from its stream, in stead of from the
+        global numpy random state.
+        '''
+        if rng is None:
+            rng = np.random
 
         self.lockdown = True
 
@@ -147,7 +173,7 @@ class Configuration():
         self.lockdown_percentage = lockdown_percentage
         self.lockdown_vector = np.zeros((self.pop_size,))
         #lockdown vector is 1 for those not complying
-        self.lockdown_vector[np.random.uniform(size=(self.pop_size,)) >= lockdown_compliance] = 1
+        self.lockdown_vector[rng.uniform(size=(self.pop_size,)) >= lockdown_compliance] = 1
 
 
     def set_self_isolation(self, self_isolate_proportion=0.9,
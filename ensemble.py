@@ -0,0 +1,283 @@
+'''
+contains the ensemble, that runs many replicas of a simulation at once
+in a single vectorized population array
+'''
+
+import sys
+
+import numpy as np
+
+from config import Configuration
+from infection import infect, recover_or_die, Recovery_calendar
+from motion import motion_step, Motion_buffers
+from neighbours import Verlet_list
+from path_planning import set_destination, check_at_destination, keep_at_destination,\
+release_recovered
+from population import initialize_population, initialize_destination_matrix,\
+Population_trackers, State_index
+from utils import Replica_streams
+
+class Ensemble():
+    '''runs replicas of the same simulation side by side
+
+    The populations of all replicas are stacked in one population matrix,
+    replica r holding rows r * replica_size up to (r + 1) * replica_size,
+    and are advanced with the same motion, infection and recovery kernels
+    as a single simulation. For small populations this takes a fraction
+    of the time of running the replicas one by one, as the Python overhead
+    of a time step is paid once for all replicas.
+
+    Every replica lives in its own copy of the world, shifted along the x axis
+    by 'spacing', so replicas can not infect each other. Healthcare capacity,
+    lockdown and patient zero apply to every replica separately, and every
+    replica has its own Population_trackers in pop_trackers.
+
+    Every replica draws from its own random stream, one of the child seeds
+    of Config.seed in rng.seeds (see Replica_streams), so the random numbers
+    of a replica do not depend on the number of replicas or on what happens
+    in the others. Replicas are still not identical to single runs seeded
+    with their child seed: their positions are shifted, and which group the
+    neighbour search starts from is decided for all replicas together.
+    Motion always uses the numpy kernels. Location registries, travel
+    schedules and visualisation are not supported.
+
+    Scenarios are set as on a Simulation, for example
+    ensemble.Config.set_lockdown(rng = ensemble.rng), followed by
+    ensemble.population_init() where a Simulation needs it as well.
+
+    Keyword arguments
+    -----------------
+    replicas : int
+        the number of replicas to run
+
+    Any other arguments are Configuration values, where pop_size is the
+    population size of each replica. Config.pop_size is set to the size
+    of all replicas together.
+    '''
+    def __init__(self, replicas=10, *args, **kwargs):
+        self.Config = Configuration(*args, **kwargs)
+
+        if self.Config.location_registry:
+            raise ValueError('location_registry is not supported in an ensemble')
+
+        self.replicas = replicas
+        self.replica_size = self.Config.pop_size
+        self.Config.pop_size = replicas * self.replica_size
+        self.frame = 0
+
+        #random number generator with a stream for every replica
+        self.rng = Replica_streams(self.Config.seed, replicas, self.replica_size,
+                                   self.Config.rng_block_size)
+
+        self.population_init()
+
+        self.pop_trackers = [Population_trackers() for i in range(replicas)]
+        #highest number of infected so far in each replica, used for the lockdown
+        self.peak_infected = np.zeros((replicas,), dtype=np.int64)
+
+        self.calendar = Recovery_calendar()
+        self.neighbour_list = Verlet_list(self.Config.verlet_skin)
+        self.motion_buffers = Motion_buffers(self.Config.pop_size)
+        self.destinations = initialize_destination_matrix(self.Config.pop_size,
+                                                          self.Config.total_destinations)
+
+
+    def population_init(self):
+        '''(re-)initializes the population of all replicas'''
+        self.population = initialize_population(self.Config, self.Config.mean_age,
+                                                self.Config.max_age, self.Config.xbounds,
+                                                self.Config.ybounds, self.rng)
+
+        #give each replica its own copy of the world, a world width apart
+        width = max(self.Config.x_plot[1], self.Config.xbounds[1]) -\
+                min(self.Config.x_plot[0], self.Config.xbounds[0])
+        self.spacing = 2 * width
+        self.offsets = np.repeat(np.arange(self.replicas) * self.spacing, self.replica_size)
+        self.population[:,1] += self.offsets
+
+        #roaming and isolation bounds per population member
+        self.xbounds = [self.offsets + (self.Config.xbounds[0] + 0.02),
+                        self.offsets + (self.Config.xbounds[1] - 0.02)]
+        self.ybounds = [self.Config.ybounds[0] + 0.02, self.Config.ybounds[1] - 0.02]
+        self.isolation_bounds = np.tile(np.asarray(self.Config.isolation_bounds, dtype=np.float64),
+                                        (self.Config.pop_size, 1))
+        self.isolation_bounds[:,0] += self.offsets
+        self.isolation_bounds[:,2] += self.offsets
+
+        self.state_index = State_index(self.population)
+
+
+    def counts(self, column, value):
+        '''returns for every replica the number of members where column equals value'''
+        return np.bincount(self.state_index.get(column, value) // self.replica_size,
+                           minlength = self.replicas)
+
+
+    def tstep(self):
+        '''
+        takes a time step in all replicas
+        '''
+
+        if self.frame == 0:
+            #pick up any changes made to the population before the first step
+            self.state_index.rebuild(self.population)
+
+        #check destinations if active
+        active_dests = self.state_index.count_not(11, 0)
+
+        if active_dests > 0 and self.state_index.count(12, 0) > 0:
+            self.population = set_destination(self.population, self.destinations, self.state_index)
+            self.population = check_at_destination(self.population, self.destinations,
+                                                   wander_factor = self.Config.wander_factor_dest,
+                                                   speed = self.Config.speed,
+                                                   state_index = self.state_index,
+                                                   rng = self.rng)
+
+        if active_dests > 0 and self.state_index.count(12, 1) > 0:
+            #keep them at destination
+            self.population = keep_at_destination(self.population, self.destinations,
+                                                  self.Config.wander_factor, self.state_index,
+                                                  self.rng)
+
+        #check in which replicas lockdown is active
+        lockdown_vector = None
+        locked = None
+        if self.Config.lockdown:
+            threshold = self.replica_size * self.Config.lockdown_percentage
+            locked_replicas = (self.counts(6, 1) >= threshold) | (self.peak_infected >= threshold)
+
+            if locked_replicas.all():
+                lockdown_vector = self.Config.lockdown_vector
+            elif locked_replicas.any():
+                lockdown_vector = self.Config.lockdown_vector
+                locked = np.repeat(locked_replicas, self.replica_size)
+
+        #out of bounds, update randoms and positions in one pass
+        self.population, self.motion_buffers = motion_step(self.population, self.xbounds, self.ybounds,
+                                                           self.Config.speed, self.motion_buffers,
+                                                           lockdown_vector,
+                                                           state_index = self.state_index,
+                                                           rng = self.rng, locked = locked)
+
+        #find new infections
+        self.population, self.destinations = infect(self.population, self.Config, self.frame,
+                                                    send_to_location = self.Config.self_isolate,
+                                                    location_bounds = self.isolation_bounds,
+                                                    destinations = self.destinations,
+                                                    location_no = 1,
+                                                    location_odds = self.Config.self_isolate_proportion,
+                                                    calendar = self.calendar,
+                                                    neighbour_list = self.neighbour_list,
+                                                    state_index = self.state_index,
+                                                    rng = self.rng,
+                                                    replica_size = self.replica_size)
+
+        #recover and die
+        self.population = recover_or_die(self.population, self.frame, self.Config,
+                                         calendar = self.calendar,
+                                         state_index = self.state_index,
+                                         rng = self.rng)
+
+        #send cured back to population if self isolation active
+        if self.Config.self_isolate:
+            release_recovered(self.population, 1, self.state_index)
+
+        #update population statistics of every replica
+        self.update_trackers()
+
+        #report stuff to console
+        if self.Config.report_freq > 0 and (self.frame % self.Config.report_freq) == 0:
+            sys.stdout.write('\r')
+            sys.stdout.write('%i: healthy: %i, infected: %i, immune: %i, in treatment: %i, \
+dead: %i, of total: %i in %i replicas' %(self.frame, self.state_index.count(6, 0),
+                                        self.state_index.count(6, 1), self.state_index.count(6, 2),
+                                        self.state_index.count(10, 1), self.state_index.count(6, 3),
+                                        self.Config.pop_size, self.replicas))
+
+        self.callback()
+
+        #update frame
+        self.frame += 1
+
+
+    def update_trackers(self):
+        '''appends the current counts of every replica to its trackers'''
+        infectious = self.counts(6, 1)
+        recovered = self.counts(6, 2)
+        fatalities = self.counts(6, 3)
+        self.peak_infected = np.maximum(self.peak_infected, infectious)
+
+        for tracker, i, r, f in zip(self.pop_trackers, infectious.tolist(), recovered.tolist(),
+                                    fatalities.tolist()):
+            tracker.infectious.append(i)
+            tracker.recovered.append(r)
+            tracker.fatalities.append(f)
+            if tracker.reinfect:
+                tracker.susceptible.append(self.replica_size - (i + f))
+            else:
+                tracker.susceptible.append(self.replica_size - (i + r + f))
+
+
+    def callback(self):
+        '''placeholder function that can be overwritten.
+
+        Called after every time step, as Simulation.callback(). Infects
+        patient zero, the first member, of every replica at frame 50.
+        '''
+
+        if self.frame == 50:
+            print('\ninfecting patient zero')
+            patients = np.arange(self.replicas) * self.replica_size
+            self.state_index.set(self.population, patients, 6, 1)
+            self.population[:,8][patients] = 50
+            self.state_index.set(self.population, patients, 10, 1)
+            self.calendar.schedule(self.population, patients, self.Config)
+
+
+    def run(self):
+        '''run all replicas
+
+        Stops after Config.simulation_steps, or if Config.endif_no_infections
+        is set, once no infectious people remain in any replica.
+        '''
+
+        i = 0
+
+        while i < self.Config.simulation_steps:
+            self.tstep()
+
+            if self.Config.endif_no_infections and self.frame >= 500:
+                if self.state_index.count(6, 1) + self.state_index.count(6, 4) == 0:
+                    i = self.Config.simulation_steps
+
+            i += 1
+
+
+    def summaries(self):
+        '''returns the outcome of every replica so far, as list of dictionaries
+
+        The dictionaries hold the same values as Simulation.summary(). The
+        number of frames is that of the ensemble, replicas that died out
+        earlier have zeros at the end of their infectious curve.
+        '''
+        dead = self.counts(6, 3)
+        recovered = self.counts(6, 2)
+        infected = self.counts(6, 1)
+        infectious = infected + self.counts(6, 4)
+        unaffected = self.counts(6, 0)
+        in_treatment = self.counts(10, 1)
+
+        summaries = []
+        for r, tracker in enumerate(self.pop_trackers):
+            curve = tracker.infectious
+            summaries.append({'frames': self.frame,
+                              'pop_size': self.replica_size,
+                              'dead': int(dead[r]),
+                              'recovered': int(recovered[r]),
+                              'infected': int(infected[r]),
+                              'infectious': int(infectious[r]),
+                              'unaffected': int(unaffected[r]),
+                              'in_treatment': int(in_treatment[r]),
+                              'peak_infectious': int(np.max(curve)) if len(curve) > 0 else 0,
+                              'peak_frame': int(np.argmax(curve)) if len(curve) > 0 else 0})
+        return summaries
@@ -3,8 +3,14 @@ this file contains all functions required in computing
 new infections, recoveries, and deaths
 '''
 
+import heapq
+
 import numpy as np
-from path_planning import go_to_location
+
+from neighbours import density_counts, find_pairs, Verlet_list
+from path_planning import go_to_location_batch
+from population import set_state
+from utils import for_members
 
 
 def find_nearby(population, infection_zone, traveling_infects=False,
@@ -64,11 +70,14 @@ def find_nearby(population, infection_zone, traveling_infects=False,
 
 def infect(population, Config, frame, send_to_location=False, 
            location_bounds=[], destinations=[], location_no=1, 
-           location_odds=1.0):
+           location_odds=1.0, calendar=None, neighbour_list=None, state_index=None,
+           rng=np.random, replica_size=None):
     '''finds new infections.
     
     Function that finds new infections in an area around infected persens
-    defined by infection_range, and infects others with chance infection_chance
+    defined by infection_range, and infects others with chance infection_chance.
+    Every infected-healthy pair within range gets its own die roll, all rolls
+    are done at once.
     
     Keyword arguments
     -----------------
@@ -100,7 +109,7 @@ def infect(population, Config, frame, send_to_location=False,
         the location bounds where the infected person is sent to and can roam
         within (xmin, ymin, xmax, ymax)
 
-    destinations : list or ndarray
+    destinations : list, ndarray or Location_registry
         the destinations vector containing destinations for each individual in the population.
         Needs to be of same length as population
 
@@ -114,89 +123,103 @@ def infect(population, Config, frame, send_to_location=False,
 
     traveling_infects : bool
         whether infected people heading to a destination can still infect others on the way there
-    '''
 
-    #mark those already infected first
-    infected_previous_step = population[population[:,6] == 1]
-    healthy_previous_step = population[population[:,6] == 0]
+    calendar : Recovery_calendar
+        if given, the frames at which the new infections resolve are added to it
 
-    new_infections = []
+    neighbour_list : Verlet_list
+        the list of candidate pairs kept between simulation steps, used
+        if Config.neighbour_method is 'verlet'
 
-    #if less than half are infected, slice based on infected (to speed up computation)
-    if len(infected_previous_step) < (Config.pop_size // 2):
-        for patient in infected_previous_step:
-            #define infection zone for patient
-            infection_zone = [patient[1] - Config.infection_range, patient[2] - Config.infection_range,
-                                patient[1] + Config.infection_range, patient[2] + Config.infection_range]
+    state_index : State_index
+        if given, used to look up who is infected and healthy, and kept up to date
 
-            #find healthy people surrounding infected patient
-            if Config.traveling_infects or patient[11] == 0:
-                indices = find_nearby(population, infection_zone, kind = 'healthy')
-            else:
-                indices = []
-
-            for idx in indices:
-                #roll die to see if healthy person will be infected
-                if np.random.random() < Config.infection_chance:
-                    population[idx][6] = 1
-                    population[idx][8] = frame
-                    if len(population[population[:,10] == 1]) <= Config.healthcare_capacity:
-                        population[idx][10] = 1
-                        if send_to_location:
-                            #send to location if die roll is positive
-                            if np.random.uniform() <= location_odds:
-                                population[idx],\
-                                destinations[idx] = go_to_location(population[idx],
-                                                                   destinations[idx],
-                                                                   location_bounds, 
-                                                                   dest_no=location_no)
-                        else:
-                            pass
-                    new_infections.append(idx)
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
+
+    replica_size : int
+        if given, the population holds replicas of this size one after the other
+        (see ensemble.py), and the healthcare capacity applies to each replica
+    '''
 
+    #find who can infect others and who can get infected
+    if state_index is None:
+        infectious = np.flatnonzero(population[:,6] == 1)
+        healthy = np.flatnonzero(population[:,6] == 0)
     else:
-        #if more than half are infected slice based in healthy people (to speed up computation)
-            
-        
-        
-        for person in healthy_previous_step:
-            #define infecftion range around healthy person
-            infection_zone = [person[1] - Config.infection_range, person[2] - Config.infection_range,
-                                person[1] + Config.infection_range, person[2] + Config.infection_range]
-
-            if person[6] == 0: #if person is not already infected, find if infected are nearby
-                #find infected nearby healthy person
-                if Config.traveling_infects:
-                    poplen = find_nearby(population, infection_zone, 
-                                         traveling_infects = True,
-                                         kind = 'infected')
-                else:
-                    poplen = find_nearby(population, infection_zone, 
-                                         traveling_infects = True,
-                                         kind = 'infected',
-                                         infected_previous_step = infected_previous_step)
-                
-                if poplen > 0:
-                    if np.random.random() < (Config.infection_chance * poplen):
-                        #roll die to see if healthy person will be infected
-                        population[np.int32(person[0])][6] = 1
-                        population[np.int32(person[0])][8] = frame
-                        if len(population[population[:,10] == 1]) <= Config.healthcare_capacity:
-                            population[np.int32(person[0])][10] = 1
-                            if send_to_location:
-                                #send to location and add to treatment if die roll is positive
-                                if np.random.uniform() < location_odds:
-                                    population[np.int32(person[0])],\
-                                    destinations[np.int32(person[0])] = go_to_location(population[np.int32(person[0])],
-                                                                                        destinations[np.int32(person[0])],
-                                                                                        location_bounds, 
-                                                                                        dest_no=location_no)
-
-
-                        new_infections.append(np.int32(person[0]))
+        infectious = state_index.get(6, 1)
+        healthy = state_index.get(6, 0)
+
+    if not Config.traveling_infects:
+        #only those not traveling to a destination can infect, unless specified
+        infectious = infectious[population[:,11][infectious] == 0]
+
+    if Config.density_approximation and len(infectious) >= (Config.pop_size // 2):
+        #if more than half are infected, approximate the number of infected around each healthy person
+        counts = density_counts(population[infectious, 1:3], population[healthy, 1:3],
+                                Config.infection_range, Config.density_resolution)
+
+        #roll die for everyone at once, odds scale with the infected nearby
+        new_infections = healthy[for_members(rng, healthy).random(len(healthy)) <
+                                 (Config.infection_chance * counts)]
+    else:
+        #find all infected-healthy pairs within range
+        if Config.neighbour_method.lower() == 'verlet':
+            if neighbour_list is None:
+                neighbour_list = Verlet_list(Config.verlet_skin)
+            infectious_mask = np.zeros((len(population),), dtype=bool)
+            infectious_mask[infectious] = True
+            healthy_mask = np.zeros((len(population),), dtype=bool)
+            healthy_mask[healthy] = True
+            _, nearby = neighbour_list.find_pairs(population[:,1:3], infectious_mask, healthy_mask,
+                                                  Config.infection_range, Config.engine)
+        else:
+            #search from the smallest group
+            if len(infectious) < len(healthy):
+                _, nearby = find_pairs(population[infectious, 1:3], population[healthy, 1:3],
+                                       Config.infection_range, Config.neighbour_method,
+                                       Config.engine)
+            else:
+                nearby, _ = find_pairs(population[healthy, 1:3], population[infectious, 1:3],
+                                       Config.infection_range, Config.neighbour_method,
+                                       Config.engine)
+            nearby = healthy[nearby]
+
+        #roll die for every pair at once, anyone with at least one positive roll gets sick
+        infected_by = nearby[for_members(rng, nearby).random(len(nearby)) < Config.infection_chance]
+        new_infections = np.unique(infected_by)
+
+    if len(new_infections) > 0:
+        set_state(population, new_infections, 6, 1, state_index)
+        population[:,8][new_infections] = frame
+
+        if calendar is not None:
+            calendar.schedule(population, new_infections, Config)
+
+        #admit new patients to treatment while occupancy is at or below capacity
+        if replica_size is not None:
+            in_treatment = admit_per_replica(population, new_infections, Config.healthcare_capacity,
+                                             replica_size, state_index)
+        else:
+            if state_index is None:
+                occupied = np.count_nonzero(population[:,10] == 1)
+            else:
+                occupied = state_index.count(10, 1)
+            free_places = Config.healthcare_capacity - occupied + 1
+            in_treatment = new_infections[:max(free_places, 0)]
+        set_state(population, in_treatment, 10, 1, state_index)
+
+        if send_to_location:
+            #send those in treatment to location if die roll is positive
+            population, destinations, _ = go_to_location_batch(population, destinations,
+                                                               in_treatment, location_bounds, 
+                                                               dest_no = location_no,
+                                                               location_odds = location_odds,
+                                                               state_index = state_index,
+                                                               rng = rng)
 
     if len(new_infections) > 0 and Config.verbose:
-        print('\nat timestep %i these people got sick: %s' %(frame, new_infections))
+        print('\nat timestep %i these people got sick: %s' %(frame, new_infections.tolist()))
 
     if len(destinations) == 0:
         return population
@@ -204,7 +227,48 @@ def infect(population, Config, frame, send_to_location=False,
         return population, destinations
 
 
-def recover_or_die(population, frame, Config):
+def admit_per_replica(population, new_infections, healthcare_capacity, replica_size,
+                      state_index=None):
+    '''returns who of the new infections gets treatment, per replica
+
+    Applies the admission rule of infect() to every replica of an ensemble
+    separately: new patients are admitted in order of their index while
+    the occupancy of their own replica is at or below capacity.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        array containing all data on the population, replicas one after the other
+
+    new_infections : ndarray
+        the sorted indices of the people that just got infected
+
+    healthcare_capacity : int
+        the number of places available in the healthcare system of each replica
+
+    replica_size : int
+        the population size of each replica
+
+    state_index : State_index
+        if given, used to look up who is in treatment
+    '''
+
+    if state_index is None:
+        treated = np.flatnonzero(population[:,10] == 1)
+    else:
+        treated = state_index.get(10, 1)
+
+    replicas = new_infections // replica_size
+    occupied = np.bincount(treated // replica_size, 
+                           minlength = (len(population) // replica_size))[replicas]
+
+    #rank of each new patient within their replica
+    rank = np.arange(len(new_infections)) - np.searchsorted(replicas, replicas)
+    return new_infections[rank < np.maximum(healthcare_capacity - occupied + 1, 0)]
+
+
+def recover_or_die(population, frame, Config, calendar=None, state_index=None,
+                   rng=np.random):
     '''see whether to recover or die
 
 
@@ -249,65 +313,192 @@ def recover_or_die(population, frame, Config):
 
     verbose : bool
         whether to report to terminal the recoveries and deaths for each simulation step
+
+    calendar : Recovery_calendar
+        if given, only the infected people scheduled to resolve up to this frame
+        are checked, in stead of all infected people
+
+    state_index : State_index
+        if given, used to look up who is infected, and kept up to date
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
     '''
 
-    #find infected people
-    infected_people = population[population[:,6] == 1]
+    if calendar is None and state_index is not None:
+        #find infected people
+        infected_people = state_index.get(6, 1)
+    elif calendar is None:
+        #find infected people
+        infected_people = np.flatnonzero(population[:,6] == 1)
+    else:
+        #find infected people due to resolve
+        infected_people = calendar.pop(frame)
+        infected_people = infected_people[population[:,6][infected_people] == 1]
+
+    if len(infected_people) == 0:
+        #nobody to check, most steps when the calendar is used
+        return population
 
     #define vector of how long everyone has been sick
-    illness_duration_vector = frame - infected_people[:,8]
+    illness_duration_vector = frame - population[:,8][infected_people]
     
     recovery_odds_vector = (illness_duration_vector - Config.recovery_duration[0]) / np.ptp(Config.recovery_duration)
     recovery_odds_vector = np.clip(recovery_odds_vector, a_min = 0, a_max = None)
 
-    #update states of sick people 
-    indices = infected_people[:,0][recovery_odds_vector >= infected_people[:,9]]
+    #find those whose illness resolves this step
+    indices = infected_people[recovery_odds_vector >= population[:,9][infected_people]]
 
-    recovered = []
-    fatalities = []
+    #look up mortality chance of each
+    if Config.age_dependent_risk:
+        mortality_chances = get_mortality_table(Config)[np.clip(np.int32(population[:,7][indices]), 0,
+                                                                Config.max_age)]
+    else:
+        mortality_chances = np.full(len(indices), Config.mortality_chance)
+
+    if Config.treatment_dependent_risk:
+        #decrease risk for those in treatment, increase it for those who are not
+        mortality_chances = mortality_chances * np.where(population[:,10][indices] == 1,
+                                                         Config.treatment_factor,
+                                                         Config.no_treatment_factor)
 
     #decide whether to die or recover
-    for idx in indices:
-        #check if we want risk to be age dependent
-        #if age_dependent_risk:
-        if Config.age_dependent_risk:
-            updated_mortality_chance = compute_mortality(infected_people[infected_people[:,0] == idx][:,7][0], 
-                                                            Config.mortality_chance,
-                                                            Config.risk_age, Config.critical_age, 
-                                                            Config.critical_mortality_chance, 
-                                                            Config.risk_increase)
-        else:
-            updated_mortality_chance = Config.mortality_chance
-
-        if infected_people[infected_people[:,0] == int(idx)][:,10] == 0 and Config.treatment_dependent_risk:
-            #if person is not in treatment, increase risk by no_treatment_factor
-            updated_mortality_chance = updated_mortality_chance * Config.no_treatment_factor
-        elif infected_people[infected_people[:,0] == int(idx)][:,10] == 1 and Config.treatment_dependent_risk:
-            #if person is in treatment, decrease risk by 
-            updated_mortality_chance = updated_mortality_chance * Config.treatment_factor
-
-        if np.random.random() <= updated_mortality_chance:
-            #die
-            infected_people[:,6][infected_people[:,0] == idx] = 3
-            infected_people[:,10][infected_people[:,0] == idx] = 0
-            fatalities.append(np.int32(infected_people[infected_people[:,0] == idx][:,0][0]))
-        else:
-            #recover (become immune)
-            infected_people[:,6][infected_people[:,0] == idx] = 2
-            infected_people[:,10][infected_people[:,0] == idx] = 0
-            recovered.append(np.int32(infected_people[infected_people[:,0] == idx][:,0][0]))
+    dies = for_members(rng, indices).random(len(indices)) <= mortality_chances
+    fatalities = indices[dies]
+    recovered = indices[~dies]
+
+    set_state(population, fatalities, 6, 3, state_index)
+    set_state(population, recovered, 6, 2, state_index) #recover (become immune)
+    set_state(population, indices, 10, 0, state_index)
 
     if len(fatalities) > 0 and Config.verbose:
-        print('\nat timestep %i these people died: %s' %(frame, fatalities))
+        print('\nat timestep %i these people died: %s' %(frame, fatalities.tolist()))
     if len(recovered) > 0 and Config.verbose:
-        print('\nat timestep %i these people recovered: %s' %(frame, recovered))
-
-    #put array back into population
-    population[population[:,6] == 1] = infected_people
+        print('\nat timestep %i these people recovered: %s' %(frame, recovered.tolist()))
 
     return population
 
 
+def density_approximation_error(population, Config):
+    '''measures the error of the density approximation in infect()
+
+    Function that compares the approximate number of infected around each
+    healthy person, as used when Config.density_approximation is set, with the
+    exact number found through Config.neighbour_method ('grid' if 'verlet').
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        array containing all data on the population
+
+    Config : class
+        the configuration class
+
+    Returns
+    -------
+    errors : dict
+        mean and max absolute error of the counts, and the expected number of new
+        infections with the exact and approximate odds
+    '''
+
+    infectious = population[:,6] == 1
+    if not Config.traveling_infects:
+        infectious = infectious & (population[:,11] == 0)
+    healthy = population[:,6] == 0
+
+    approximate = density_counts(population[infectious, 1:3], population[healthy, 1:3],
+                                 Config.infection_range, Config.density_resolution)
+
+    #the verlet list finds the same pairs as the grid, but only pays off over many steps
+    method = Config.neighbour_method
+    if method.lower() == 'verlet':
+        method = 'grid'
+
+    nearby, _ = find_pairs(population[healthy, 1:3], population[infectious, 1:3],
+                           Config.infection_range, method, Config.engine)
+    exact = np.bincount(nearby, minlength = np.count_nonzero(healthy))
+
+    errors = {'mean_abs_error': float(np.mean(np.abs(approximate - exact))) if len(exact) > 0 else 0.0,
+              'max_abs_error': float(np.max(np.abs(approximate - exact))) if len(exact) > 0 else 0.0,
+              'expected_infections_exact': float(np.sum(1 - (1 - Config.infection_chance) ** exact)),
+              'expected_infections_approximate': float(np.sum(np.clip(Config.infection_chance * approximate, 
+                                                                      0, 1)))}
+
+    return errors
+
+
+def compute_resolution_frames(population, indices, Config):
+    '''computes the frames at which illnesses resolve
+
+    Function that computes for each infected person the first frame at which
+    recover_or_die() will decide whether they recover or die. This follows
+    from the frame they got infected (column 8), their recovery vector
+    (column 9) and Config.recovery_duration.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        array containing all data on the population
+
+    indices : ndarray
+        the indices of the infected people
+
+    Config : class
+        the configuration class
+    '''
+
+    infected_since = population[:,8][indices]
+    recovery_vector = population[:,9][indices]
+
+    def resolves(frames):
+        #same test as in recover_or_die()
+        recovery_odds = ((frames - infected_since) - Config.recovery_duration[0]) / np.ptp(Config.recovery_duration)
+        return np.clip(recovery_odds, a_min = 0, a_max = None) >= recovery_vector
+
+    frames = infected_since + np.ceil(Config.recovery_duration[0] + 
+                                      (recovery_vector * np.ptp(Config.recovery_duration)))
+    #recovery odds are never below zero, so a recovery vector at or below zero resolves at once
+    frames = np.where(recovery_vector <= 0, infected_since, frames)
+
+    #correct for floating point rounding, so frames are exactly the first frames that resolve
+    frames = np.where(resolves(frames - 1) & (frames > infected_since), frames - 1, frames)
+    frames = np.where(resolves(frames), frames, frames + 1)
+
+    return np.int64(frames)
+
+
+def get_mortality_table(Config):
+    '''returns mortality chance for every age
+
+    Function that computes the mortality chance for all ages from 0 up to
+    and including Config.max_age using compute_mortality(), so that it can
+    be indexed by age. The table is computed once and stored on the
+    configuration, it is only recomputed when one of the risk parameters
+    changes.
+
+    Keyword arguments
+    -----------------
+    Config : class
+        the configuration class
+    '''
+
+    params = (Config.max_age, Config.mortality_chance, Config.risk_age,
+              Config.critical_age, Config.critical_mortality_chance,
+              Config.risk_increase)
+
+    cached = getattr(Config, '_mortality_table', None)
+    if cached is None or cached[0] != params:
+        table = np.array([compute_mortality(age, Config.mortality_chance,
+                                            Config.risk_age, Config.critical_age,
+                                            Config.critical_mortality_chance,
+                                            Config.risk_increase)
+                          for age in range(int(Config.max_age) + 1)], dtype=np.float64)
+        cached = (params, table)
+        Config._mortality_table = cached
+
+    return cached[1]
+
+
 def compute_mortality(age, mortality_chance, risk_age=50,
                       critical_age=80, critical_mortality_chance=0.5,
                       risk_increase='linear'):
@@ -370,7 +561,8 @@ def compute_mortality(age, mortality_chance, risk_age=50,
         return critical_mortality_chance
 
 
-def healthcare_infection_correction(worker_population, healthcare_risk_factor=0.2):
+def healthcare_infection_correction(worker_population, healthcare_risk_factor=0.2,
+                                    rng=np.random):
     '''corrects infection to healthcare population.
 
     Takes the healthcare risk factor and adjusts the sick healthcare workers
@@ -386,12 +578,15 @@ def healthcare_infection_correction(worker_population, healthcare_risk_factor=0.
         if other than one, defines the change in odds of contracting an infection.
         Can be used to simulate healthcare personell having extra protections in place (< 1)
         or being more at risk due to exposure, fatigue, or other factors (> 1)
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
     '''
 
     if healthcare_risk_factor < 0:
         #set 1 - healthcare_risk_factor workers to non sick
         sick_workers = worker_population[:,6][worker_population[:,6] == 1]
-        cure_vector = np.random.uniform((len(sick_workers)))
+        cure_vector = rng.uniform((len(sick_workers)))
         sick_workers[:,6][cure_vector >= healthcare_risk_factor] = 0
     elif healthcare_risk_factor > 0:
         #TODO: make proportion of extra workers sick
@@ -399,4 +594,67 @@ def healthcare_infection_correction(worker_population, healthcare_risk_factor=0.
     else:
         pass #if no changed risk, do nothing
 
-    return worker_population
\ No newline at end of file
+    return worker_population
+
+class Recovery_calendar():
+    '''calendar of the frames at which illnesses resolve
+
+    Infected people are added when they get sick, in a bucket for the frame
+    at which their illness resolves. Each simulation step only the buckets
+    that are due are taken out, so recover_or_die() does not need to check
+    everyone who is infected.
+
+    Anyone that gets infected outside of infect() needs to be added
+    through schedule() as well.
+    '''
+    def __init__(self):
+        self.buckets = {}
+        self.frames = [] #heap of frames that have a bucket
+
+    def __len__(self):
+        return sum([len(x) for bucket in self.buckets.values() for x in bucket])
+
+    def schedule(self, population, indices, Config):
+        '''adds infected people to the calendar
+
+        Keyword arguments
+        -----------------
+        population : ndarray
+            array containing all data on the population
+
+        indices : ndarray
+            the indices of the infected people to add
+
+        Config : class
+            the configuration class
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return
+
+        frames = compute_resolution_frames(population, indices, Config)
+        order = np.argsort(frames, kind='stable')
+        indices = indices[order]
+        frames = frames[order]
+
+        unique_frames, starts = np.unique(frames, return_index=True)
+        for frame, bucket in zip(unique_frames, np.split(indices, starts[1:])):
+            frame = int(frame)
+            if frame not in self.buckets:
+                self.buckets[frame] = []
+                heapq.heappush(self.frames, frame)
+            self.buckets[frame].append(bucket)
+
+    def pop(self, frame):
+        '''takes out everyone due to resolve at or before frame
+
+        Returns a sorted array of unique indices
+        '''
+        due = []
+        while len(self.frames) > 0 and self.frames[0] <= frame:
+            due.extend(self.buckets.pop(heapq.heappop(self.frames)))
+
+        if len(due) == 0:
+            return np.zeros((0,), dtype=np.int64)
+
+        return np.unique(np.concatenate(due))
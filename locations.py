@@ -0,0 +1,156 @@
+'''
+contains the location registry, a shared table of the locations
+population members can be sent to
+'''
+
+import numpy as np
+
+from motion import get_motion_parameters
+
+class Location_registry():
+    '''shared table of locations and the destinations of each member
+
+    Can be used in stead of the destinations matrix from
+    initialize_destination_matrix(). Every location is stored once, as a row
+    holding its bounds, center and wander ranges. For every population member
+    and destination number only the id of the location is stored (-1 if none),
+    so memory grows with the number of locations in stead of with the
+    population size times the number of destinations.
+
+    Keyword arguments
+    -----------------
+    pop_size : int
+        the size of the population
+
+    total_destinations : int
+        the number of destinations to maintain per member. Set to more than
+        one if for example people can go to work, supermarket, home, etc.
+    '''
+    def __init__(self, pop_size, total_destinations=1):
+        #location rows, grown by doubling, of which the first 'count' are used
+        self.count = 0
+        self._bounds = np.zeros((1, 4))
+        self._centers = np.zeros((1, 2))
+        self._wander_ranges = np.zeros((1, 2))
+        self.ids = np.full((pop_size, total_destinations), -1, dtype=np.int32)
+        self.lookup = {} #location id of each set of bounds
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def bounds(self):
+        return self._bounds[:self.count]
+
+    @property
+    def centers(self):
+        return self._centers[:self.count]
+
+    @property
+    def wander_ranges(self):
+        return self._wander_ranges[:self.count]
+
+    @property
+    def nbytes(self):
+        return self._bounds.nbytes + self._centers.nbytes +\
+               self._wander_ranges.nbytes + self.ids.nbytes
+
+    def grow(self):
+        '''doubles the number of location rows that can be stored'''
+        capacity = 2 * len(self._bounds)
+        for name in ['_bounds', '_centers', '_wander_ranges']:
+            rows = getattr(self, name)
+            grown = np.zeros((capacity, rows.shape[1]))
+            grown[:self.count] = rows[:self.count]
+            setattr(self, name, grown)
+
+    def add(self, location_bounds):
+        '''adds a location and returns its id
+
+        Locations with the same bounds are stored only once.
+
+        Keyword arguments
+        -----------------
+        location_bounds : list or tuple
+            the bounds of the location, format: [xmin, ymin, xmax, ymax]
+        '''
+        key = tuple([float(bound) for bound in location_bounds])
+
+        if key not in self.lookup:
+            if self.count == len(self._bounds):
+                self.grow()
+            x_center, y_center, x_wander, y_wander = get_motion_parameters(*key)
+            self._bounds[self.count] = key
+            self._centers[self.count] = x_center, y_center
+            self._wander_ranges[self.count] = x_wander, y_wander
+            self.lookup[key] = self.count
+            self.count += 1
+
+        return self.lookup[key]
+
+    def assign(self, members, location_bounds, dest_no=1):
+        '''sets a location as destination of the given members
+
+        Keyword arguments
+        -----------------
+        members : int or ndarray
+            the indices of the population members
+
+        location_bounds : list or tuple
+            the bounds of the location, format: [xmin, ymin, xmax, ymax]
+
+        dest_no : int
+            the destination number to set the location for
+
+        Returns
+        -------
+        location : int
+            the id of the location
+        '''
+        location = self.add(location_bounds)
+        self.ids[members, dest_no - 1] = location
+        return location
+
+    def assign_many(self, members, bounds_array, dest_no=1):
+        '''sets a location per member as their destination
+
+        Members with the same bounds share a location, which is added once.
+
+        Keyword arguments
+        -----------------
+        members : ndarray
+            the indices of the population members
+
+        bounds_array : ndarray
+            array of shape (len(members), 4) with the bounds of the location
+            of each member, format: [xmin, ymin, xmax, ymax]
+
+        dest_no : int
+            the destination number to set the locations for
+
+        Returns
+        -------
+        locations : ndarray
+            the id of the location of each member
+        '''
+        bounds_array = np.asarray(bounds_array, dtype=np.float64).reshape(-1, 4)
+        unique_bounds, inverse = np.unique(bounds_array, axis=0, return_inverse=True)
+        unique_ids = np.array([self.add(bounds) for bounds in unique_bounds], dtype=np.int32)
+
+        locations = unique_ids[inverse.reshape(-1)]
+        self.ids[members, dest_no - 1] = locations
+        return locations
+
+    def get_coordinates(self, members, dest_no):
+        '''returns the centers of a destination of each member
+
+        Keyword arguments
+        -----------------
+        members : ndarray
+            the indices of the population members
+
+        dest_no : int or ndarray
+            the destination number, or for each member its destination number
+        '''
+        location = self.ids[members, np.asarray(dest_no, dtype=np.int64) - 1]
+        return self.centers[location, 0], self.centers[location, 1]
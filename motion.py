@@ -5,6 +5,9 @@ and related computations
 
 import numpy as np
 
+from utils import for_members
+
+
 def update_positions(population):
     '''update positions of all people
 
@@ -26,7 +29,7 @@ def update_positions(population):
     return population
 
 
-def out_of_bounds(population, xbounds, ybounds):
+def out_of_bounds(population, xbounds, ybounds, rng=np.random):
     '''checks which people are about to go out of bounds and corrects
 
     Function that updates headings of individuals that are about to 
@@ -39,6 +42,9 @@ def out_of_bounds(population, xbounds, ybounds):
 
     xbounds, ybounds : list or tuple
         contains the lower and upper bounds of the world [min, max]
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
     '''
     #update headings and positions where out of bounds
     #update x heading
@@ -47,7 +53,7 @@ def out_of_bounds(population, xbounds, ybounds):
     shp = population[:,3][(population[:,1] <= xbounds[:,0]) &
                             (population[:,3] < 0)].shape
     population[:,3][(population[:,1] <= xbounds[:,0]) &
-                    (population[:,3] < 0)] = np.clip(np.random.normal(loc = 0.5, 
+                    (population[:,3] < 0)] = np.clip(rng.normal(loc = 0.5, 
                                                                         scale = 0.5/3,
                                                                         size = shp),
                                                         a_min = 0.05, a_max = 1)
@@ -55,7 +61,7 @@ def out_of_bounds(population, xbounds, ybounds):
     shp = population[:,3][(population[:,1] >= xbounds[:,1]) &
                             (population[:,3] > 0)].shape
     population[:,3][(population[:,1] >= xbounds[:,1]) &
-                    (population[:,3] > 0)] = np.clip(-np.random.normal(loc = 0.5, 
+                    (population[:,3] > 0)] = np.clip(-rng.normal(loc = 0.5, 
                                                                         scale = 0.5/3,
                                                                         size = shp),
                                                         a_min = -1, a_max = -0.05)
@@ -64,7 +70,7 @@ def out_of_bounds(population, xbounds, ybounds):
     shp = population[:,4][(population[:,2] <= ybounds[:,0]) &
                             (population[:,4] < 0)].shape
     population[:,4][(population[:,2] <= ybounds[:,0]) &
-                    (population[:,4] < 0)] = np.clip(np.random.normal(loc = 0.5, 
+                    (population[:,4] < 0)] = np.clip(rng.normal(loc = 0.5, 
                                                                         scale = 0.5/3,
                                                                         size = shp),
                                                         a_min = 0.05, a_max = 1)
@@ -72,7 +78,7 @@ def out_of_bounds(population, xbounds, ybounds):
     shp = population[:,4][(population[:,2] >= ybounds[:,1]) &
                             (population[:,4] > 0)].shape
     population[:,4][(population[:,2] >= ybounds[:,1]) &
-                    (population[:,4] > 0)] = np.clip(-np.random.normal(loc = 0.5, 
+                    (population[:,4] > 0)] = np.clip(-rng.normal(loc = 0.5, 
                                                                         scale = 0.5/3,
                                                                         size = shp),
                                                         a_min = -1, a_max = -0.05)
@@ -82,7 +88,7 @@ def out_of_bounds(population, xbounds, ybounds):
 
 def update_randoms(population, pop_size, speed=0.01, heading_update_chance=0.02, 
                    speed_update_chance=0.02, heading_multiplication=1,
-                   speed_multiplication=1):
+                   speed_multiplication=1, rng=np.random, members=None):
     '''updates random states such as heading and speed
     
     Function that randomized the headings and speeds for population members
@@ -111,27 +117,32 @@ def update_randoms(population, pop_size, speed=0.01, heading_update_chance=0.02,
     speed : int or float
         mean speed of population members, speeds will be taken from gaussian distribution
         with mean 'speed' and sd 'speed / 3'
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
+
+    members : ndarray
+        if population holds a subset of the population, the indices of its
+        rows in the whole population, used to draw for them (see for_members())
     '''
 
+    if members is None:
+        members = np.arange(pop_size)
+
     #randomly update heading
     #x
-    update = np.random.random(size=(pop_size,))
-    shp = update[update <= heading_update_chance].shape
-    population[:,3][update <= heading_update_chance] = np.random.normal(loc = 0, 
-                                                        scale = 1/3,
-                                                        size = shp) * heading_multiplication
+    updated = for_members(rng, members).random(size=(pop_size,)) <= heading_update_chance
+    population[:,3][updated] = for_members(rng, members[updated]).normal(loc = 0, scale = 1/3,
+                                   size = np.count_nonzero(updated)) * heading_multiplication
     #y
-    update = np.random.random(size=(pop_size,))
-    shp = update[update <= heading_update_chance].shape
-    population[:,4][update <= heading_update_chance] = np.random.normal(loc = 0, 
-                                                        scale = 1/3,
-                                                        size = shp) * heading_multiplication
+    updated = for_members(rng, members).random(size=(pop_size,)) <= heading_update_chance
+    population[:,4][updated] = for_members(rng, members[updated]).normal(loc = 0, scale = 1/3,
+                                   size = np.count_nonzero(updated)) * heading_multiplication
     #randomize speeds
-    update = np.random.random(size=(pop_size,))
-    shp = update[update <= heading_update_chance].shape
-    population[:,5][update <= heading_update_chance] = np.random.normal(loc = speed, 
-                                                        scale = speed / 3,
-                                                        size = shp) * speed_multiplication
+    updated = for_members(rng, members).random(size=(pop_size,)) <= heading_update_chance
+    population[:,5][updated] = for_members(rng, members[updated]).normal(loc = speed,
+                                   scale = speed / 3,
+                                   size = np.count_nonzero(updated)) * speed_multiplication
 
     population[:,5] = np.clip(population[:,5], a_min=0.0001, a_max=0.05)
     return population
@@ -157,3 +168,170 @@ def get_motion_parameters(xmin, ymin, xmax, ymax):
     y_wander = (ymax - ymin) / 2
 
     return x_center, y_center, x_wander, y_wander
+
+
+class Motion_buffers():
+    '''preallocated scratch arrays used by motion_step()
+
+    Keyword arguments
+    -----------------
+    pop_size : int
+        the size of the population
+    '''
+    def __init__(self, pop_size):
+        self.pop_size = pop_size
+        self.mask = np.zeros((pop_size,), dtype=bool)
+        self.condition = np.zeros((pop_size,), dtype=bool)
+        self.free = np.zeros((pop_size,), dtype=bool)
+        self.values = np.zeros((pop_size,))
+
+
+def _reflect(position, heading, bound, lower, buffers, rng):
+    '''points headings back into the world for free agents at a bound, in place'''
+
+    mask = buffers.mask
+    condition = buffers.condition
+
+    if lower:
+        np.less_equal(position, bound, out=mask)
+        np.less(heading, 0, out=condition)
+    else:
+        np.greater_equal(position, bound, out=mask)
+        np.greater(heading, 0, out=condition)
+
+    np.logical_and(mask, condition, out=mask)
+    np.logical_and(mask, buffers.free, out=mask)
+
+    n = np.count_nonzero(mask)
+    if n > 0:
+        if lower:
+            heading[mask] = np.clip(for_members(rng, mask).normal(loc = 0.5, scale = 0.5/3,
+                                                                  size = n),
+                                    a_min = 0.05, a_max = 1)
+        else:
+            heading[mask] = np.clip(-for_members(rng, mask).normal(loc = 0.5, scale = 0.5/3,
+                                                                   size = n),
+                                    a_min = -1, a_max = -0.05)
+
+
+def _randomize(column, chance, loc, scale, multiplication, buffers, rng, only=None):
+    '''replaces values in column with chance 'chance' by gaussian draws, in place
+
+    If only is given, values are only replaced, and drawn for, where only is True.
+    '''
+
+    if only is not None:
+        #only draw for those whose values can be replaced
+        members = np.flatnonzero(only)
+        buffers.mask[:] = False
+        buffers.mask[members] = for_members(rng, members).random(len(members)) <= chance
+    elif isinstance(rng, np.random.Generator):
+        #draw into the scratch array in stead of allocating a new one
+        rng.random(out=buffers.values)
+        np.less_equal(buffers.values, chance, out=buffers.mask)
+    else:
+        np.less_equal(rng.random(size=(len(column),)), chance, out=buffers.mask)
+
+    n = np.count_nonzero(buffers.mask)
+    if n > 0:
+        column[buffers.mask] = for_members(rng, buffers.mask).normal(loc = loc, scale = scale,
+                                                                     size = n) * multiplication
+
+
+def motion_step(population, xbounds, ybounds, speed=0.01, buffers=None,
+                lockdown_vector=None, heading_update_chance=0.02, state_index=None,
+                rng=np.random, locked=None):
+    '''moves the population one time step, in place
+
+    Function that combines out_of_bounds(), update_randoms() and update_positions()
+    in a single pass over the population that works in place on the population
+    matrix and uses preallocated scratch arrays, in stead of copying subsets out
+    and back in. Also sets heading of the dead to 0. Takes the same random draws
+    as the separate functions do.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    xbounds, ybounds : list or tuple
+        contains the lower and upper bounds of the world [min, max], applied to
+        everyone without an active destination. The bounds can also be arrays
+        with a bound per population member
+
+    speed : int or float
+        mean speed of population members
+
+    buffers : Motion_buffers
+        the scratch arrays to use, created if None or of the wrong size
+
+    lockdown_vector : ndarray
+        if given, speeds are restricted in stead of randomized: everyone's speed
+        is capped at 0.001, and those marked 0 (complying) stand still
+
+    heading_update_chance : float
+        the odds of updating the heading and speed of each member, each time step
+
+    state_index : State_index
+        if given, used to look up the dead
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
+
+    locked : ndarray
+        boolean array marking who the lockdown applies to, everyone if None.
+        The others move as they would without lockdown
+    '''
+
+    if buffers is None or buffers.pop_size != len(population):
+        buffers = Motion_buffers(len(population))
+
+    x = population[:,1]
+    y = population[:,2]
+    heading_x = population[:,3]
+    heading_y = population[:,4]
+    speeds = population[:,5]
+
+    #out of bounds, only for those without a destination
+    np.equal(population[:,11], 0, out=buffers.free)
+    _reflect(x, heading_x, xbounds[0], True, buffers, rng)
+    _reflect(x, heading_x, xbounds[1], False, buffers, rng)
+    _reflect(y, heading_y, ybounds[0], True, buffers, rng)
+    _reflect(y, heading_y, ybounds[1], False, buffers, rng)
+
+    if lockdown_vector is None or locked is not None:
+        #randomly update heading and speed, of those not in lockdown
+        free = None if lockdown_vector is None else ~locked
+        _randomize(heading_x, heading_update_chance, 0, 1/3, 1, buffers, rng, free)
+        _randomize(heading_y, heading_update_chance, 0, 1/3, 1, buffers, rng, free)
+        _randomize(speeds, heading_update_chance, speed, speed / 3, 1, buffers, rng, free)
+        np.clip(speeds, 0.0001, 0.05, out=speeds)
+
+    if lockdown_vector is not None and locked is None:
+        #reduce speed of all members of society
+        np.minimum(speeds, 0.001, out=speeds)
+        #set speeds of complying people to 0
+        np.equal(lockdown_vector, 0, out=buffers.mask)
+        speeds[buffers.mask] = 0
+    elif lockdown_vector is not None:
+        #reduce speed of those in lockdown, and set speeds of complying people to 0
+        speeds[locked] = np.minimum(speeds[locked], 0.001)
+        speeds[locked & (lockdown_vector == 0)] = 0
+
+    #for dead ones: set speed and heading to 0
+    if state_index is None:
+        np.equal(population[:,6], 3, out=buffers.mask)
+        heading_x[buffers.mask] = 0
+        heading_y[buffers.mask] = 0
+    else:
+        dead = state_index.get(6, 3)
+        heading_x[dead] = 0
+        heading_y[dead] = 0
+
+    #update positions
+    np.multiply(heading_x, speeds, out=buffers.values)
+    np.add(x, buffers.values, out=x)
+    np.multiply(heading_y, speeds, out=buffers.values)
+    np.add(y, buffers.values, out=y)
+
+    return population, buffers
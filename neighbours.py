@@ -0,0 +1,609 @@
+'''
+contains methods to find pairs of population members that are
+within infection range of each other
+
+All methods share the same interface: they take the coordinates of the
+sources and targets and the infection range, and return the row indices
+of all pairs where the target lies within the infection zone of the source.
+The method used is set through Configuration.neighbour_method.
+'''
+
+import numpy as np
+
+import numba_engine
+from numba_engine import use_numba
+
+def _empty_pairs():
+    '''returns an empty pair of index arrays'''
+    return np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.int64)
+
+
+def in_zone(sources, targets, radius):
+    '''checks whether targets are within the infection zone of sources
+
+    The infection zone is the open rectangle used throughout the simulation:
+    [x - radius, y - radius, x + radius, y + radius], see find_nearby().
+
+    Keyword arguments
+    -----------------
+    sources : ndarray
+        array of shape (n, 2) with the x and y coordinates at the zone centers
+
+    targets : ndarray
+        array of shape (n, 2) with the x and y coordinates to test
+
+    radius : int or float
+        half the width of the infection zone
+    '''
+
+    return ((sources[:,0] - radius < targets[:,0]) &
+            (targets[:,0] < sources[:,0] + radius) &
+            (sources[:,1] - radius < targets[:,1]) &
+            (targets[:,1] < sources[:,1] + radius))
+
+
+def brute_force_pairs(sources, targets, radius, chunk_size=1024):
+    '''finds all source-target pairs within range by comparing all of them
+
+    Reference method that tests every source against every target, in chunks
+    of sources to limit memory use. Cost scales with sources * targets.
+
+    Keyword arguments
+    -----------------
+    sources : ndarray
+        array of shape (n, 2) with the x and y coordinates of the agents
+        at the center of each infection zone
+
+    targets : ndarray
+        array of shape (m, 2) with the x and y coordinates of the agents
+        that are looked for
+
+    radius : int or float
+        half the width of the infection zone
+
+    chunk_size : int
+        the number of sources compared to all targets at once
+    '''
+
+    if len(sources) == 0 or len(targets) == 0:
+        return _empty_pairs()
+
+    source_idx = []
+    target_idx = []
+
+    for start in range(0, len(sources), chunk_size):
+        chunk = sources[start:start + chunk_size]
+        in_range = ((chunk[:,0,None] - radius < targets[None,:,0]) &
+                    (targets[None,:,0] < chunk[:,0,None] + radius) &
+                    (chunk[:,1,None] - radius < targets[None,:,1]) &
+                    (targets[None,:,1] < chunk[:,1,None] + radius))
+        s, t = np.nonzero(in_range)
+        source_idx.append(s + start)
+        target_idx.append(t)
+
+    return np.int64(np.concatenate(source_idx)), np.int64(np.concatenate(target_idx))
+
+
+def build_grid(sources, targets, radius):
+    '''builds a uniform grid (spatial hash) over the targets
+
+    Buckets the targets into square cells with sides of length 'radius',
+    and finds the cell of each source.
+
+    Returns
+    -------
+    order : ndarray
+        indices of the targets, sorted on cell
+
+    sorted_keys : ndarray
+        the cell key of each target in order
+
+    source_keys : ndarray
+        the cell key of each source
+
+    offsets : ndarray
+        the key offsets to a cell and its eight surrounding cells
+    '''
+
+    #map everyone onto grid cells, with one empty cell of padding on all sides
+    origin = np.minimum(sources.min(axis=0), targets.min(axis=0)) - radius
+    target_cells = np.int64((targets - origin) // radius)
+    source_cells = np.int64((sources - origin) // radius)
+    ny = max(target_cells[:,1].max(), source_cells[:,1].max()) + 2
+
+    #sort targets on their cell key
+    target_keys = target_cells[:,0] * ny + target_cells[:,1]
+    order = np.argsort(target_keys, kind='stable')
+    sorted_keys = target_keys[order]
+
+    source_keys = source_cells[:,0] * ny + source_cells[:,1]
+    offsets = np.array([dx * ny + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+    return order, sorted_keys, source_keys, offsets
+
+
+def grid_pairs(sources, targets, radius, engine='numpy'):
+    '''finds all source-target pairs within range using a uniform grid
+
+    Function that buckets the targets into square cells with sides of
+    length 'radius' (a spatial hash), and compares every source only to
+    the targets in its own and the eight surrounding cells. Cost scales
+    with the number of agents and candidate pairs, in stead of with
+    sources * targets.
+
+    Keyword arguments
+    -----------------
+    sources : ndarray
+        array of shape (n, 2) with the x and y coordinates of the agents
+        at the center of each infection zone
+
+    targets : ndarray
+        array of shape (m, 2) with the x and y coordinates of the agents
+        that are looked for
+
+    radius : int or float
+        half the width of the infection zone
+
+    engine : str
+        if 'numba', the cells are scanned with the compiled kernel from
+        numba_engine, if installed
+
+    Returns
+    -------
+    source_idx, target_idx : ndarray
+        row indices into sources and targets for every pair where the target
+        lies within the infection zone of the source. Pairs are sorted
+        on source, then target, matching the order of a loop over sources.
+    '''
+
+    if len(sources) == 0 or len(targets) == 0:
+        return _empty_pairs()
+
+    order, sorted_keys, source_keys, offsets = build_grid(sources, targets, radius)
+
+    if use_numba(engine):
+        return numba_engine.scan_grid(sources, targets, radius, order, sorted_keys,
+                                      source_keys, offsets)
+
+    #look up the range of targets in each of the nine surrounding cells
+    cell_keys = (source_keys[:,None] + offsets[None,:]).ravel()
+    starts = np.searchsorted(sorted_keys, cell_keys, side='left')
+    counts = np.searchsorted(sorted_keys, cell_keys, side='right') - starts
+
+    #expand ranges into candidate pairs
+    total = counts.sum()
+    if total == 0:
+        return _empty_pairs()
+
+    source_idx = np.repeat(np.arange(len(sources)).repeat(len(offsets)), counts)
+    first = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    target_idx = order[first + np.arange(total)]
+
+    #keep those that are actually in range
+    keep = in_zone(sources[source_idx], targets[target_idx], radius)
+    source_idx = source_idx[keep]
+    target_idx = target_idx[keep]
+
+    sort = np.lexsort((target_idx, source_idx))
+    return source_idx[sort], target_idx[sort]
+
+
+def kdtree_pairs(sources, targets, radius):
+    '''finds all source-target pairs within range using a KD-tree
+
+    Function that builds a static KD-tree on the targets and queries it
+    for all sources using the Chebyshev (max-coordinate) distance, which
+    matches the square infection zone. The tree is rebuilt on every call,
+    which is every simulation step. Handles strongly clustered populations
+    well, for example when many people are sent to the same location.
+
+    Requires scipy, which is imported on first use.
+
+    Keyword arguments
+    -----------------
+    sources : ndarray
+        array of shape (n, 2) with the x and y coordinates of the agents
+        at the center of each infection zone
+
+    targets : ndarray
+        array of shape (m, 2) with the x and y coordinates of the agents
+        that are looked for
+
+    radius : int or float
+        half the width of the infection zone
+    '''
+
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        raise ImportError('neighbour method \'kdtree\' requires scipy to be installed')
+
+    if len(sources) == 0 or len(targets) == 0:
+        return _empty_pairs()
+
+    tree = cKDTree(targets)
+    nearby = tree.query_ball_point(sources, r = radius, p = np.inf, 
+                                   return_sorted = True)
+
+    counts = np.array([len(x) for x in nearby], dtype=np.int64)
+    if counts.sum() == 0:
+        return _empty_pairs()
+
+    source_idx = np.repeat(np.arange(len(sources)), counts)
+    target_idx = np.int64(np.concatenate([x for x in nearby if len(x) > 0]))
+
+    #the tree includes the zone edges, the infection zone does not
+    keep = in_zone(sources[source_idx], targets[target_idx], radius)
+
+    return source_idx[keep], target_idx[keep]
+
+
+def density_counts(sources, targets, radius, resolution=4):
+    '''approximates the number of sources within range of every target
+
+    Function that rasterises the sources onto a grid with cells of size
+    2 * radius / resolution and computes a summed-area table from it. The
+    number of sources in each infection zone is then read from the table
+    with four lookups, treating the sources as evenly spread within each
+    cell. Cost scales with the number of agents and grid cells, not with the
+    number of pairs. Accuracy improves with resolution.
+
+    Keyword arguments
+    -----------------
+    sources : ndarray
+        array of shape (n, 2) with the x and y coordinates of the agents
+        that are counted
+
+    targets : ndarray
+        array of shape (m, 2) with the x and y coordinates of the agents
+        at the center of each infection zone
+
+    radius : int or float
+        half the width of the infection zone
+
+    resolution : int
+        the number of grid cells along each side of an infection zone
+
+    Returns
+    -------
+    counts : ndarray
+        the approximate number of sources within range of each target
+    '''
+
+    if len(sources) == 0 or len(targets) == 0:
+        return np.zeros((len(targets),))
+
+    cell_size = 2 * radius / resolution
+
+    #rasterise sources, with a zone of padding on all sides
+    origin = np.minimum(sources.min(axis=0), targets.min(axis=0)) - 2 * radius
+    extent = np.maximum(sources.max(axis=0), targets.max(axis=0)) + 2 * radius
+    nx, ny = np.int64(np.ceil((extent - origin) / cell_size)) + 1
+
+    cells = np.int64((sources - origin) // cell_size)
+    grid = np.bincount(cells[:,0] * ny + cells[:,1], minlength = nx * ny).reshape((nx, ny))
+
+    #summed-area table, table[i, j] holds the sources in all cells below i and j
+    table = np.zeros((nx + 1, ny + 1))
+    table[1:,1:] = grid.cumsum(axis=0).cumsum(axis=1)
+
+    def cumulative(x, y):
+        #interpolate the table, which gives the exact count for evenly spread cells
+        u = np.clip((x - origin[0]) / cell_size, 0, nx)
+        v = np.clip((y - origin[1]) / cell_size, 0, ny)
+        i = np.minimum(np.int64(u), nx - 1)
+        j = np.minimum(np.int64(v), ny - 1)
+        fu = u - i
+        fv = v - j
+        return ((table[i, j] * (1 - fu) * (1 - fv)) + (table[i + 1, j] * fu * (1 - fv)) +
+                (table[i, j + 1] * (1 - fu) * fv) + (table[i + 1, j + 1] * fu * fv))
+
+    x = targets[:,0]
+    y = targets[:,1]
+    counts = (cumulative(x + radius, y + radius) - cumulative(x - radius, y + radius) -
+              cumulative(x + radius, y - radius) + cumulative(x - radius, y - radius))
+
+    return np.clip(counts, a_min = 0, a_max = None)
+
+
+neighbour_methods = {'brute': brute_force_pairs,
+                     'grid': grid_pairs,
+                     'kdtree': kdtree_pairs}
+
+
+def find_pairs(sources, targets, radius, method='grid', engine='numpy'):
+    '''finds all source-target pairs within range
+
+    Dispatches to the neighbour search method set in the configuration.
+
+    Keyword arguments
+    -----------------
+    sources : ndarray
+        array of shape (n, 2) with the x and y coordinates of the agents
+        at the center of each infection zone
+
+    targets : ndarray
+        array of shape (m, 2) with the x and y coordinates of the agents
+        that are looked for
+
+    radius : int or float
+        half the width of the infection zone
+
+    method : str
+        the neighbour search method, can be 'brute', 'grid' or 'kdtree'
+
+    engine : str
+        the engine set in the configuration, can be 'numpy' or 'numba'
+
+    Returns
+    -------
+    source_idx, target_idx : ndarray
+        row indices into sources and targets for every pair where the target
+        lies within the infection zone of the source, sorted on source, then target.
+    '''
+
+    try:
+        pair_method = neighbour_methods[method.lower()]
+    except KeyError:
+        raise ValueError('neighbour method %s not understood! Must be one of %s' 
+                         %(method, ', '.join(neighbour_methods)))
+
+    if pair_method is grid_pairs:
+        return grid_pairs(sources, targets, radius, engine)
+
+    return pair_method(sources, targets, radius)
+
+
+class Verlet_list():
+    '''list of candidate pairs that is reused over multiple simulation steps
+
+    Keeps for everyone the population members within infection range plus
+    a 'skin' margin, as sorted neighbour indices per member. As long as
+    nobody has moved more than half the skin since the list was built,
+    every pair within infection range is guaranteed to be in the list, so
+    a step only checks the listed neighbours of the sources, in stead of
+    bucketing the targets into a new grid. The list is rebuilt when
+    someone has moved further.
+
+    A rebuild finds all pairs of the population within range plus skin,
+    which costs as much as many steps of searching the grid directly. If
+    the list had to be rebuilt within min_frames() steps, the pairs are
+    searched with grid_pairs() in stead for the next 'rebuild_frames' steps,
+    a period that doubles every time the list turns out not to last. After
+    such a period the list is only rebuilt if the movement seen since the
+    last build allows the largest skin to last min_frames() steps.
+
+    The pairs found do not depend on the list or when it was built: they
+    are all pairs within range, sorted on source, then target.
+
+    With skin None, the skin starts at the infection range, and is sized
+    from the movement seen between rebuilds to last twice min_frames()
+    steps, but at most 'max_skin' times the infection range. Pays off for
+    populations that move slowly compared to the infection range, such as
+    under lockdown.
+
+    Keyword arguments
+    -----------------
+    skin : None, int or float
+        the extra margin added to the infection range when building the
+        list, None to size it from the movement of the population
+
+    rebuild_frames : int
+        the least number of steps an adapted skin should last, and the
+        first number of steps to search directly
+
+    max_skin : int or float
+        the largest adapted skin, as multiple of the infection range
+    '''
+    def __init__(self, skin=None, rebuild_frames=10, max_skin=2):
+        self.adaptive = skin is None
+        self.skin = skin
+        self.rebuild_frames = rebuild_frames
+        self.max_skin = max_skin
+        self.radius = None
+        self.positions = None #positions at the time of the last build
+        self.frames = 0 #number of steps since the last build
+        self.starts = np.zeros((1,), dtype=np.int64)
+        self.neighbours = np.zeros((0,), dtype=np.int32)
+        self.rebuilds = 0
+        self.listing = False #whether the list holds all pairs in range
+        self.direct_frames = 0 #steps left to search the grid directly
+        self.backoff = rebuild_frames
+        self._difference = None
+
+    def min_frames(self):
+        '''returns the number of steps the list needs to last to pay off
+
+        Building the list takes about as long as five grid searches, plus
+        three per neighbour listed for each member, measured on populations
+        of 2000 and 20000 members.
+        '''
+        if self.positions is None or len(self.positions) == 0:
+            return 5
+        return 5 + 3 * len(self.neighbours) / len(self.positions)
+
+    def displacement(self, positions):
+        '''returns the furthest anyone moved along x or y since the last build'''
+        if self._difference is None or self._difference.shape != positions.shape:
+            self._difference = np.zeros(positions.shape)
+        np.subtract(positions, self.positions, out=self._difference)
+        return max(self._difference.max(), -self._difference.min())
+
+    def needs_rebuild(self, positions, radius):
+        '''checks whether anyone moved more than half the skin since the last build
+
+        Resizes the skin from the movement since the last build if adaptive.
+        '''
+        self.frames += 1
+        displacement = self.displacement(positions)
+        if displacement <= (self.skin / 2):
+            return False
+
+        if self.adaptive:
+            self.resize(displacement / self.frames)
+        return True
+
+    def resize(self, rate):
+        '''sizes the skin to last twice as long as the list needs to pay off,
+        given the furthest distance anyone moves in a step'''
+        frames = max(self.rebuild_frames, 2 * self.min_frames())
+        self.skin = min(2 * rate * frames, self.max_skin * self.radius)
+
+    def pays_off(self, positions):
+        '''checks whether a new list would last long enough to pay off
+
+        Estimates from the movement since the last build how many steps
+        the largest skin would last.
+        '''
+        self.frames += 1
+        displacement = self.displacement(positions)
+        if displacement == 0:
+            return True
+
+        rate = displacement / self.frames
+        if self.adaptive:
+            self.resize(rate)
+        skin = self.max_skin * self.radius if self.adaptive else self.skin
+        return (skin / 2) / rate >= self.min_frames()
+
+    def search_directly(self):
+        '''searches the grid directly for a while, longer every time in a row'''
+        self.listing = False
+        self.direct_frames = self.backoff - 1
+        self.backoff *= 2
+        return False
+
+    def update(self, positions, radius, engine='numpy'):
+        '''rebuilds the list if needed
+
+        Returns whether the list is used this step, False if the pairs are
+        searched directly.
+
+        Keyword arguments
+        -----------------
+        positions : ndarray
+            array of shape (n, 2) with the x and y coordinates of everyone
+
+        radius : int or float
+            half the width of the infection zone
+
+        engine : str
+            the engine set in the configuration, can be 'numpy' or 'numba'
+        '''
+        if self.direct_frames > 0:
+            self.direct_frames -= 1
+            self.frames += 1
+            return False
+
+        if self.positions is None or len(positions) != len(self.positions) or\
+           radius != self.radius:
+            self.listing = False
+            self.backoff = self.rebuild_frames
+        elif not self.listing:
+            #after searching directly, only build if the movement allows it
+            if not self.pays_off(positions):
+                return self.search_directly()
+        elif not self.needs_rebuild(positions, radius):
+            return True
+        elif self.frames < self.min_frames():
+            #the list did not last long enough to pay off
+            return self.search_directly()
+        else:
+            self.backoff = self.rebuild_frames
+
+        if self.skin is None:
+            #first build, before any movement is seen
+            self.skin = radius
+
+        first, second = grid_pairs(positions, positions, radius + self.skin, engine)
+        keep = first != second
+        self.starts = np.searchsorted(first[keep], np.arange(len(positions) + 1))
+        self.neighbours = np.int32(second[keep])
+
+        self.positions = positions.copy()
+        self.radius = radius
+        self.frames = 0
+        self.listing = True
+        self.rebuilds += 1
+        return True
+
+    def listed(self, members):
+        '''returns the listed pairs of members and their neighbours, sorted on member'''
+        counts = self.starts[members + 1] - self.starts[members]
+        total = counts.sum()
+        if total == 0:
+            return _empty_pairs()
+
+        member_idx = np.repeat(members, counts)
+        first = np.repeat(self.starts[members] - (np.cumsum(counts) - counts), counts)
+        return member_idx, np.int64(self.neighbours[first + np.arange(total)])
+
+    def find_pairs(self, positions, sources, targets, radius, engine='numpy'):
+        '''finds all source-target pairs within range
+
+        Keyword arguments
+        -----------------
+        positions : ndarray
+            array of shape (n, 2) with the x and y coordinates of everyone
+
+        sources : ndarray
+            boolean array marking who is at the center of an infection zone
+
+        targets : ndarray
+            boolean array marking who is looked for
+
+        radius : int or float
+            half the width of the infection zone
+
+        engine : str
+            the engine set in the configuration, can be 'numpy' or 'numba'
+
+        Returns
+        -------
+        source_idx, target_idx : ndarray
+            indices into positions for every pair where the target lies
+            within the infection zone of the source, sorted on source, then target
+        '''
+        source_members = np.flatnonzero(sources)
+        target_members = np.flatnonzero(targets)
+
+        if len(source_members) == 0 or len(target_members) == 0:
+            #nothing to look up, the list is checked at the next step
+            self.frames += 1
+            return _empty_pairs()
+
+        use_list = self.update(positions, radius, engine)
+
+        #search from the smallest group
+        from_sources = len(source_members) <= len(target_members)
+        if use_list and from_sources:
+            source_idx, target_idx = self.listed(source_members)
+            keep = targets[target_idx]
+        elif use_list:
+            target_idx, source_idx = self.listed(target_members)
+            keep = sources[source_idx]
+        elif from_sources:
+            source_idx, target_idx = grid_pairs(positions[source_members], positions[target_members],
+                                                radius, engine)
+            source_idx = source_members[source_idx]
+            target_idx = target_members[target_idx]
+        else:
+            target_idx, source_idx = grid_pairs(positions[target_members], positions[source_members],
+                                                radius, engine)
+            source_idx = source_members[source_idx]
+            target_idx = target_members[target_idx]
+
+        if use_list:
+            source_idx = source_idx[keep]
+            target_idx = target_idx[keep]
+            keep = in_zone(positions[source_idx], positions[target_idx], radius)
+            source_idx = source_idx[keep]
+            target_idx = target_idx[keep]
+
+        if not from_sources:
+            #sort on source, then target
+            order = np.lexsort((target_idx, source_idx))
+            source_idx = source_idx[order]
+            target_idx = target_idx[order]
+
+        return source_idx, target_idx
@@ -0,0 +1,158 @@
+'''
+contains an optional engine that runs the computationally heavy parts
+of the simulation as compiled Numba kernels
+
+The engine is used when Config.engine is set to 'numba'. When Numba is not
+installed, the simulation falls back to the NumPy functions in motion.py,
+path_planning.py and neighbours.py. The kernels themselves are in
+numba_kernels.py, which is only imported once the engine is used, so
+importing the simulation does not import Numba (and the modules it loads).
+
+Compiled kernels are cached on disk, in __pycache__ or in the folder set
+through the NUMBA_CACHE_DIR environment variable, so only the first run
+pays for compilation.
+
+Random numbers inside the kernels are drawn from Numba's own generator,
+which can be seeded through seed(). Every thread has its own stream, so
+runs are only reproducible when set to a single thread (NUMBA_NUM_THREADS=1).
+'''
+
+import importlib.util
+
+import numpy as np
+
+from locations import Location_registry
+
+#looked up without importing Numba, the kernels are imported on first use
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+engines = ['numpy', 'numba']
+_fallback_reported = False
+
+
+def use_numba(engine='numpy'):
+    '''checks whether the numba engine should be used
+
+    Returns True if the numba engine is requested and Numba is installed.
+    If it is requested but not installed, a message is printed once and
+    the NumPy engine is used.
+
+    Keyword arguments
+    -----------------
+    engine : str
+        the engine set in the configuration, can be 'numpy' or 'numba'
+    '''
+    global _fallback_reported
+
+    if engine.lower() not in engines:
+        raise ValueError('engine %s not understood! Must be one of %s'
+                         %(engine, ', '.join(engines)))
+
+    if engine.lower() == 'numba' and not NUMBA_AVAILABLE:
+        if not _fallback_reported:
+            print('\nnumba is not installed, falling back to numpy engine')
+            _fallback_reported = True
+        return False
+
+    return engine.lower() == 'numba'
+
+
+def seed(seed):
+    '''seeds the random number generator used inside the kernels'''
+    import numba_kernels
+    numba_kernels.seed(seed)
+
+
+def update_positions(population):
+    '''update positions of all people, see motion.update_positions()'''
+    import numba_kernels
+
+    numba_kernels.update_positions(population[:,1], population[:,2], population[:,3],
+                                   population[:,4], population[:,5])
+
+    return population
+
+
+def out_of_bounds(population, xbounds, ybounds):
+    '''checks which people are about to go out of bounds and corrects
+
+    Like motion.out_of_bounds(), but works in place on everyone without an
+    active destination, and takes the bounds as [min, max] for the whole world.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    xbounds, ybounds : list or tuple
+        contains the lower and upper bounds of the world [min, max]
+    '''
+    import numba_kernels
+
+    numba_kernels.out_of_bounds(population[:,1], population[:,2], population[:,3],
+                                population[:,4], population[:,11], xbounds[0], xbounds[1],
+                                ybounds[0], ybounds[1])
+
+    return population
+
+
+def update_randoms(population, pop_size, speed=0.01, heading_update_chance=0.02,
+                   speed_update_chance=0.02, heading_multiplication=1,
+                   speed_multiplication=1):
+    '''updates random states such as heading and speed, see motion.update_randoms()'''
+    import numba_kernels
+
+    numba_kernels.update_randoms(population[:,3], population[:,4], population[:,5], speed,
+                                 heading_update_chance, heading_multiplication,
+                                 speed_multiplication)
+
+    return population
+
+
+def keep_at_destination(population, destinations, wander_factor=1):
+    '''keeps those who have arrived within wander range, see path_planning.keep_at_destination()'''
+    import numba_kernels
+
+    if isinstance(destinations, Location_registry):
+        numba_kernels.keep_at_location(population[:,1], population[:,2], population[:,3],
+                                       population[:,4], population[:,5], population[:,11],
+                                       population[:,12], population[:,13], population[:,14],
+                                       destinations.ids, destinations.centers, wander_factor)
+    else:
+        numba_kernels.keep_at_destination(population[:,1], population[:,2], population[:,3],
+                                          population[:,4], population[:,5], population[:,11],
+                                          population[:,12], population[:,13], population[:,14],
+                                          destinations, wander_factor)
+
+    return population
+
+
+def scan_grid(sources, targets, radius, order, sorted_keys, source_keys, offsets):
+    '''finds all source-target pairs within range from a prepared grid
+
+    Compiled version of the pair scan in neighbours.grid_pairs(), the grid
+    itself is built there.
+
+    Returns
+    -------
+    source_idx, target_idx : ndarray
+        row indices into sources and targets, sorted on source, then target.
+    '''
+    import numba_kernels
+
+    sx = np.ascontiguousarray(sources[:,0])
+    sy = np.ascontiguousarray(sources[:,1])
+    tx = np.ascontiguousarray(targets[:,0])
+    ty = np.ascontiguousarray(targets[:,1])
+
+    counts = np.zeros(len(sources), dtype=np.int64)
+    numba_kernels.count_grid_pairs(sx, sy, tx, ty, order, sorted_keys, source_keys,
+                                   offsets, radius, counts)
+
+    starts = np.cumsum(counts) - counts
+    source_idx = np.zeros(counts.sum(), dtype=np.int64)
+    target_idx = np.zeros(counts.sum(), dtype=np.int64)
+    numba_kernels.fill_grid_pairs(sx, sy, tx, ty, order, sorted_keys, source_keys,
+                                  offsets, radius, starts, source_idx, target_idx)
+
+    return source_idx, target_idx
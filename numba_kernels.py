@@ -0,0 +1,140 @@
+'''
+contains the compiled Numba kernels of the numba engine
+
+Importing this module imports Numba, so it is only imported by the
+functions in numba_engine.py once the numba engine is used, see
+numba_engine.use_numba().
+'''
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def seed(seed):
+    np.random.seed(seed)
+
+
+@njit(parallel=True, cache=True)
+def update_positions(x, y, heading_x, heading_y, speed):
+    for i in prange(len(x)):
+        x[i] += heading_x[i] * speed[i]
+        y[i] += heading_y[i] * speed[i]
+
+
+@njit(parallel=True, cache=True)
+def out_of_bounds(x, y, heading_x, heading_y, active_dest,
+                  xmin, xmax, ymin, ymax):
+    for i in prange(len(x)):
+        if active_dest[i] != 0:
+            continue
+
+        if x[i] <= xmin and heading_x[i] < 0:
+            heading_x[i] = min(max(np.random.normal(0.5, 0.5 / 3), 0.05), 1)
+        elif x[i] >= xmax and heading_x[i] > 0:
+            heading_x[i] = min(max(-np.random.normal(0.5, 0.5 / 3), -1), -0.05)
+
+        if y[i] <= ymin and heading_y[i] < 0:
+            heading_y[i] = min(max(np.random.normal(0.5, 0.5 / 3), 0.05), 1)
+        elif y[i] >= ymax and heading_y[i] > 0:
+            heading_y[i] = min(max(-np.random.normal(0.5, 0.5 / 3), -1), -0.05)
+
+
+@njit(parallel=True, cache=True)
+def update_randoms(heading_x, heading_y, speed, mean_speed,
+                   heading_update_chance, heading_multiplication,
+                   speed_multiplication):
+    for i in prange(len(speed)):
+        if np.random.random() <= heading_update_chance:
+            heading_x[i] = np.random.normal(0, 1 / 3) * heading_multiplication
+        if np.random.random() <= heading_update_chance:
+            heading_y[i] = np.random.normal(0, 1 / 3) * heading_multiplication
+        if np.random.random() <= heading_update_chance:
+            speed[i] = np.random.normal(mean_speed, mean_speed / 3) * speed_multiplication
+
+        speed[i] = min(max(speed[i], 0.0001), 0.05)
+
+
+@njit(cache=True)
+def _wander_back(i, dest_x, dest_y, x, y, heading_x, heading_y, speed,
+                 wander_x, wander_y, wander_factor):
+    if x[i] > dest_x + (wander_x[i] * wander_factor):
+        heading_x[i] = -np.random.normal(0.5, 0.5 / 3)
+    elif x[i] < dest_x - (wander_x[i] * wander_factor):
+        heading_x[i] = np.random.normal(0.5, 0.5 / 3)
+
+    if y[i] > dest_y + (wander_y[i] * wander_factor):
+        heading_y[i] = -np.random.normal(0.5, 0.5 / 3)
+    elif y[i] < dest_y - (wander_y[i] * wander_factor):
+        heading_y[i] = np.random.normal(0.5, 0.5 / 3)
+
+    #slow speed
+    speed[i] = np.random.normal(0.005, 0.005 / 3)
+
+
+@njit(parallel=True, cache=True)
+def keep_at_destination(x, y, heading_x, heading_y, speed, active_dest,
+                        at_dest, wander_x, wander_y, destinations,
+                        wander_factor):
+    for i in prange(len(x)):
+        d = int(active_dest[i])
+        if d == 0 or at_dest[i] != 1:
+            continue
+
+        _wander_back(i, destinations[i, (d - 1) * 2], destinations[i, ((d - 1) * 2) + 1],
+                     x, y, heading_x, heading_y, speed, wander_x, wander_y,
+                     wander_factor)
+
+
+@njit(parallel=True, cache=True)
+def keep_at_location(x, y, heading_x, heading_y, speed, active_dest,
+                     at_dest, wander_x, wander_y, location_ids, centers,
+                     wander_factor):
+    for i in prange(len(x)):
+        d = int(active_dest[i])
+        if d == 0 or at_dest[i] != 1:
+            continue
+
+        location = location_ids[i, d - 1]
+        _wander_back(i, centers[location, 0], centers[location, 1],
+                     x, y, heading_x, heading_y, speed, wander_x, wander_y,
+                     wander_factor)
+
+
+@njit(cache=True)
+def _in_zone(sx, sy, tx, ty, radius):
+    return (sx - radius < tx) and (tx < sx + radius) and\
+           (sy - radius < ty) and (ty < sy + radius)
+
+
+@njit(parallel=True, cache=True)
+def count_grid_pairs(sx, sy, tx, ty, order, sorted_keys, source_keys,
+                     offsets, radius, counts):
+    for i in prange(len(sx)):
+        n = 0
+        for offset in offsets:
+            key = source_keys[i] + offset
+            lo = np.searchsorted(sorted_keys, key, side='left')
+            hi = np.searchsorted(sorted_keys, key, side='right')
+            for j in range(lo, hi):
+                if _in_zone(sx[i], sy[i], tx[order[j]], ty[order[j]], radius):
+                    n += 1
+        counts[i] = n
+
+
+@njit(parallel=True, cache=True)
+def fill_grid_pairs(sx, sy, tx, ty, order, sorted_keys, source_keys,
+                    offsets, radius, starts, source_idx, target_idx):
+    for i in prange(len(sx)):
+        n = starts[i]
+        for offset in offsets:
+            key = source_keys[i] + offset
+            lo = np.searchsorted(sorted_keys, key, side='left')
+            hi = np.searchsorted(sorted_keys, key, side='right')
+            for j in range(lo, hi):
+                if _in_zone(sx[i], sy[i], tx[order[j]], ty[order[j]], radius):
+                    source_idx[n] = i
+                    target_idx[n] = order[j]
+                    n += 1
+        #sort targets of each source
+        target_idx[starts[i]:n] = np.sort(target_idx[starts[i]:n])
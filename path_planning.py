@@ -6,6 +6,9 @@ and path planning
 import numpy as np
 
 from motion import get_motion_parameters, update_randoms
+from locations import Location_registry
+from population import set_state
+from utils import for_members
 
 def go_to_location(patient, destination, location_bounds, dest_no=1):
     '''sends patient to defined location
@@ -18,8 +21,9 @@ def go_to_location(patient, destination, location_bounds, dest_no=1):
     patient : 1d array
         1d array of the patient data, is a row from population matrix
 
-    destination : 1d array
-        1d array of the destination data, is a row from destination matrix
+    destination : 1d array or Location_registry
+        1d array of the destination data, is a row from destination matrix,
+        or the location registry if used
 
     location_bounds : list or tuple
         defines bounds for the location the patient will be roam in when sent
@@ -29,9 +33,7 @@ def go_to_location(patient, destination, location_bounds, dest_no=1):
         the location number, used as index for destinations array if multiple possible
         destinations are defined`.
 
-
-    TODO: vectorize
-
+    See go_to_location_batch() to send many at once.
     '''
 
     x_center, y_center, x_wander, y_wander = get_motion_parameters(location_bounds[0],
@@ -41,15 +43,144 @@ def go_to_location(patient, destination, location_bounds, dest_no=1):
     patient[13] = x_wander
     patient[14] = y_wander
     
-    destination[(dest_no - 1) * 2] = x_center
-    destination[((dest_no - 1) * 2) + 1] = y_center
+    if isinstance(destination, Location_registry):
+        destination.assign(int(patient[0]), location_bounds, dest_no)
+    else:
+        destination[(dest_no - 1) * 2] = x_center
+        destination[((dest_no - 1) * 2) + 1] = y_center
 
     patient[11] = dest_no #set destination active
 
     return patient, destination
 
 
-def set_destination(population, destinations):
+def go_to_location_batch(population, destinations, members, location_bounds, 
+                         dest_no=1, location_odds=1.0, state_index=None, rng=np.random):
+    '''sends a group of population members to defined location
+
+    Vectorized version of go_to_location(). Rolls for each member whether
+    they comply with being sent, and sets the location as active destination
+    for all of those who do at once.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    destinations : ndarray or Location_registry
+        the array containing all destinations information
+
+    members : ndarray
+        indices of the population members to send
+
+    location_bounds : list, tuple or ndarray
+        defines bounds for the location the members will roam in when sent
+        there. format: [xmin, ymin, xmax, ymax]. Can also be an array of shape
+        (pop_size, 4) with the bounds per population member
+
+    dest_no : int
+        the location number, used as index for destinations array if multiple possible
+        destinations are defined
+
+    location_odds : float
+        the odds that a member complies with being sent to the location
+
+    state_index : State_index
+        if given, kept up to date with the active destinations
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
+
+    Returns
+    -------
+    population, destinations : ndarray
+        the updated population and destinations
+
+    sent : ndarray
+        the indices of the members that were sent
+    '''
+
+    members = np.asarray(members, dtype=np.int64)
+    sent = members[for_members(rng, members).random(len(members)) <= location_odds]
+
+    if np.ndim(location_bounds) == 2:
+        #bounds per population member
+        location_bounds = location_bounds[sent].T
+
+    x_center, y_center, x_wander, y_wander = get_motion_parameters(location_bounds[0],
+                                                                    location_bounds[1],
+                                                                    location_bounds[2],
+                                                                    location_bounds[3])
+    population[:,13][sent] = x_wander
+    population[:,14][sent] = y_wander
+
+    if isinstance(destinations, Location_registry) and np.ndim(location_bounds) == 2:
+        destinations.assign_many(sent, np.transpose(location_bounds), dest_no)
+    elif isinstance(destinations, Location_registry):
+        destinations.assign(sent, location_bounds, dest_no)
+    else:
+        destinations[sent, (dest_no - 1) * 2] = x_center
+        destinations[sent, ((dest_no - 1) * 2) + 1] = y_center
+
+    set_state(population, sent, 11, dest_no, state_index) #set destination active
+
+    return population, destinations, sent
+
+
+def get_destination_members(population, at_destination=0, state_index=None):
+    '''returns the indices of those with an active destination
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    at_destination : int
+        0 to return those still traveling, 1 to return those who arrived
+
+    state_index : State_index
+        if given, used to look up the members in stead of testing everyone
+    '''
+
+    if state_index is None:
+        return np.flatnonzero((population[:,11] != 0) &
+                              (population[:,12] == at_destination))
+
+    return np.intersect1d(state_index.get_not(11, 0),
+                          state_index.get(12, at_destination), 
+                          assume_unique=True)
+
+
+def get_destination_coordinates(population, destinations, members):
+    '''returns the coordinates of the active destination of each member
+
+    Looks up the destination of all members at once, from the column of
+    the destinations matrix that belongs to their active destination.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    destinations : ndarray or Location_registry
+        the array containing all destinations information
+
+    members : ndarray
+        indices of the population members, all with an active destination
+    '''
+
+    dest_no = np.int64(population[:,11][members])
+
+    if isinstance(destinations, Location_registry):
+        return destinations.get_coordinates(members, dest_no)
+
+    dest_x = destinations[members, (dest_no - 1) * 2]
+    dest_y = destinations[members, ((dest_no - 1) * 2) + 1]
+
+    return dest_x, dest_y
+
+
+def set_destination(population, destinations, state_index=None):
     '''sets destination of population
 
     Sets the destination of population if destination marker is not 0.
@@ -60,40 +191,29 @@ def set_destination(population, destinations):
     population : ndarray
         the array containing all the population information
 
-    destinations : ndarray
+    destinations : ndarray or Location_registry
         the array containing all destinations information
+
+    state_index : State_index
+        if given, used to look up who is traveling
     '''
-    
-    #how many destinations are active
-    active_dests = np.unique(population[:,11][population[:,11] != 0])
-
-    #set destination
-    for d in active_dests:
-        dest_x = destinations[:,int((d - 1) * 2)]
-        dest_y = destinations[:,int(((d - 1) * 2) + 1)]
-
-        #compute new headings
-        head_x = dest_x - population[:,1]
-        head_y = dest_y - population[:,2]
-
-        #head_x = head_x / np.sqrt(head_x)
-        #head_y = head_y / np.sqrt(head_y)
-
-        #reinsert headings into population of those not at destination yet
-        population[:,3][(population[:,11] == d) &
-                        (population[:,12] == 0)] = head_x[(population[:,11] == d) &
-                                                            (population[:,12] == 0)]
-        population[:,4][(population[:,11] == d) &
-                        (population[:,12] == 0)] = head_y[(population[:,11] == d) &
-                                                            (population[:,12] == 0)]
-        #set speed to 0.01
-        population[:,5][(population[:,11] == d) &
-                        (population[:,12] == 0)] = 0.02
+
+    #those traveling to their destination
+    traveling = get_destination_members(population, 0, state_index)
+    dest_x, dest_y = get_destination_coordinates(population, destinations, traveling)
+
+    #compute new headings
+    population[:,3][traveling] = dest_x - population[:,1][traveling]
+    population[:,4][traveling] = dest_y - population[:,2][traveling]
+
+    #set speed to 0.02
+    population[:,5][traveling] = 0.02
 
     return population
 
 
-def check_at_destination(population, destinations, wander_factor=1.5, speed = 0.01):
+def check_at_destination(population, destinations, wander_factor=1.5, speed = 0.01,
+                         state_index=None, rng=np.random):
     '''check who is at their destination already
 
     Takes subset of population with active destination and
@@ -105,46 +225,45 @@ def check_at_destination(population, destinations, wander_factor=1.5, speed = 0.
     population : ndarray
         the array containing all the population information
 
-    destinations : ndarray
+    destinations : ndarray or Location_registry
         the array containing all destinations information
 
     wander_factor : int or float
         defines how far outside of 'wander range' the destination reached
         is triggered
-    '''
 
-    #how many destinations are active
-    active_dests = np.unique(population[:,11][(population[:,11] != 0)])
+    state_index : State_index
+        if given, used to look up who is traveling and kept up to date 
+        with those who arrived
 
-    #see who is at destination
-    for d in active_dests:
-        dest_x = destinations[:,int((d - 1) * 2)]
-        dest_y = destinations[:,int(((d - 1) * 2) + 1)]
-
-        #see who arrived at destination and filter out who already was there
-        at_dest = population[(np.abs(population[:,1] - dest_x) < (population[:,13] * wander_factor)) & 
-                                (np.abs(population[:,2] - dest_y) < (population[:,14] * wander_factor)) &
-                                (population[:,12] == 0)]
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
+    '''
 
-        if len(at_dest) > 0:
-            #mark those as arrived
-            at_dest[:,12] = 1
-            #insert random headings and speeds for those at destination
-            at_dest = update_randoms(at_dest, pop_size = len(at_dest), speed = speed,
-                                     heading_update_chance = 1, speed_update_chance = 1)
+    #see who arrived at destination, of those still traveling
+    traveling = get_destination_members(population, 0, state_index)
+    dest_x, dest_y = get_destination_coordinates(population, destinations, traveling)
 
-            #at_dest[:,5] = 0.001
+    arrived = traveling[(np.abs(population[:,1][traveling] - dest_x) < 
+                         (population[:,13][traveling] * wander_factor)) &
+                        (np.abs(population[:,2][traveling] - dest_y) < 
+                         (population[:,14][traveling] * wander_factor))]
 
-            #reinsert into population
-            population[(np.abs(population[:,1] - dest_x) < (population[:,13] * wander_factor)) & 
-                        (np.abs(population[:,2] - dest_y) < (population[:,14] * wander_factor)) &
-                        (population[:,12] == 0)] = at_dest
+    if len(arrived) > 0:
+        #insert random headings and speeds for those at destination
+        at_dest = update_randoms(population[arrived], pop_size = len(arrived), speed = speed,
+                                 heading_update_chance = 1, speed_update_chance = 1,
+                                 rng = rng, members = arrived)
+        population[arrived, 3:6] = at_dest[:,3:6]
 
+        #mark those as arrived
+        set_state(population, arrived, 12, 1, state_index)
 
     return population
         
 
-def keep_at_destination(population, destinations, wander_factor=1):
+def keep_at_destination(population, destinations, wander_factor=1, state_index=None,
+                        rng=np.random):
     '''keeps those who have arrived, within wander range
 
     Function that keeps those who have been marked as arrived at their
@@ -155,68 +274,81 @@ def keep_at_destination(population, destinations, wander_factor=1):
     population : ndarray
         the array containing all the population information
 
-    destinations : ndarray
+    destinations : ndarray or Location_registry
         the array containing all destinations information
 
     wander_factor : int or float
         defines how far outside of 'wander range' the destination reached
         is triggered
-    ''' 
 
-    #how many destinations are active
-    active_dests = np.unique(population[:,11][(population[:,11] != 0) &
-                                                (population[:,12] == 1)])
+    state_index : State_index
+        if given, used to look up who has arrived
 
-    for d in active_dests:
-        dest_x = destinations[:,int((d - 1) * 2)][(population[:,12] == 1) &
-                                                    (population[:,11] == d)]
-        dest_y = destinations[:,int(((d - 1) * 2) + 1)][(population[:,12] == 1) &
-                                                        (population[:,11] == d)]
-
-        #see who is marked as arrived
-        arrived = population[(population[:,12] == 1) &
-                                (population[:,11] == d)]
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
+    ''' 
 
-        ids = np.int32(arrived[:,0]) # find unique IDs of arrived persons
-        
-        #check if there are those out of bounds
-        #replace x oob
-        #where x larger than destination + wander, AND heading wrong way, set heading negative
-        shp = arrived[:,3][arrived[:,1] > (dest_x + (arrived[:,13] * wander_factor))].shape
-
-        arrived[:,3][arrived[:,1] > (dest_x + (arrived[:,13] * wander_factor))] = -np.random.normal(loc = 0.5,
-                                                                scale = 0.5 / 3,
-                                                                size = shp)
-
-
-        #where x smaller than destination - wander, set heading positive
-        shp = arrived[:,3][arrived[:,1] < (dest_x - (arrived[:,13] * wander_factor))].shape
-        arrived[:,3][arrived[:,1] < (dest_x - (arrived[:,13] * wander_factor))] = np.random.normal(loc = 0.5,
-                                                            scale = 0.5 / 3,
-                                                            size = shp)
-        #where y larger than destination + wander, set heading negative
-        shp = arrived[:,4][arrived[:,2] > (dest_y + (arrived[:,14] * wander_factor))].shape
-        arrived[:,4][arrived[:,2] > (dest_y + (arrived[:,14] * wander_factor))] = -np.random.normal(loc = 0.5,
-                                                                scale = 0.5 / 3,
-                                                                size = shp)
-        #where y smaller than destination - wander, set heading positive
-        shp = arrived[:,4][arrived[:,2] < (dest_y - (arrived[:,14] * wander_factor))].shape
-        arrived[:,4][arrived[:,2] < (dest_y - (arrived[:,14] * wander_factor))] = np.random.normal(loc = 0.5,
-                                                            scale = 0.5 / 3,
-                                                            size = shp)
-
-        #slow speed
-        arrived[:,5] = np.random.normal(loc = 0.005,
-                                        scale = 0.005 / 3, 
-                                        size = arrived[:,5].shape)
-
-        #reinsert into population
-        population[(population[:,12] == 1) &
-                    (population[:,11] == d)] = arrived
+    arrived = get_destination_members(population, 1, state_index)
+    dest_x, dest_y = get_destination_coordinates(population, destinations, arrived)
+
+    x = population[:,1][arrived]
+    y = population[:,2][arrived]
+    wander_x = population[:,13][arrived] * wander_factor
+    wander_y = population[:,14][arrived] * wander_factor
+
+    #check if there are those out of bounds
+    #where x larger than destination + wander, set heading negative
+    outside = arrived[x > (dest_x + wander_x)]
+    population[:,3][outside] = -for_members(rng, outside).normal(loc = 0.5, scale = 0.5 / 3,
+                                                                 size = len(outside))
+    #where x smaller than destination - wander, set heading positive
+    outside = arrived[x < (dest_x - wander_x)]
+    population[:,3][outside] = for_members(rng, outside).normal(loc = 0.5, scale = 0.5 / 3,
+                                                                size = len(outside))
+    #where y larger than destination + wander, set heading negative
+    outside = arrived[y > (dest_y + wander_y)]
+    population[:,4][outside] = -for_members(rng, outside).normal(loc = 0.5, scale = 0.5 / 3,
+                                                                 size = len(outside))
+    #where y smaller than destination - wander, set heading positive
+    outside = arrived[y < (dest_y - wander_y)]
+    population[:,4][outside] = for_members(rng, outside).normal(loc = 0.5, scale = 0.5 / 3,
+                                                                size = len(outside))
+
+    #slow speed
+    population[:,5][arrived] = for_members(rng, arrived).normal(loc = 0.005, scale = 0.005 / 3,
+                                                                size = len(arrived))
                                 
     return population
 
 
+def release_recovered(population, location_no=1, state_index=None):
+    '''sends the recovered at a location back to the population
+
+    Clears the active destination of the recovered whose active destination
+    is the location, such as the self-isolation location infect() sends
+    people to. Others with an active destination, for example on a leg
+    of their travel schedule, keep it.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    location_no : int
+        the destination number of the location
+
+    state_index : State_index
+        if given, used to look up the recovered and kept up to date
+    '''
+    if state_index is None:
+        recovered = np.flatnonzero(population[:,6] == 2)
+    else:
+        recovered = state_index.get(6, 2)
+
+    set_state(population, recovered[population[:,11][recovered] == location_no], 11, 0,
+              state_index)
+
+
 def reset_destinations(population, ids=[]):
     '''clears destination markers
 
@@ -8,11 +8,12 @@ import os
 
 import numpy as np
 
+from locations import Location_registry
 from motion import get_motion_parameters
 from utils import check_folder
 
 def initialize_population(Config, mean_age=45, max_age=105,
-                          xbounds=[0, 1], ybounds=[0, 1]):
+                          xbounds=[0, 1], ybounds=[0, 1], rng=np.random):
     '''initialized the population for the simulation
 
     the population matrix for this simulation has the following columns:
@@ -49,6 +50,9 @@ def initialize_population(Config, mean_age=45, max_age=105,
 
     ybounds : 2d array
         lower and upper bounds of y axis
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
     '''
 
     #initialize population matrix
@@ -58,23 +62,23 @@ def initialize_population(Config, mean_age=45, max_age=105,
     population[:,0] = [x for x in range(Config.pop_size)]
 
     #initialize random coordinates
-    population[:,1] = np.random.uniform(low = xbounds[0] + 0.05, high = xbounds[1] - 0.05, 
+    population[:,1] = rng.uniform(low = xbounds[0] + 0.05, high = xbounds[1] - 0.05, 
                                         size = (Config.pop_size,))
-    population[:,2] = np.random.uniform(low = ybounds[0] + 0.05, high = ybounds[1] - 0.05, 
+    population[:,2] = rng.uniform(low = ybounds[0] + 0.05, high = ybounds[1] - 0.05, 
                                         size=(Config.pop_size,))
 
     #initialize random headings -1 to 1
-    population[:,3] = np.random.normal(loc = 0, scale = 1/3, 
+    population[:,3] = rng.normal(loc = 0, scale = 1/3, 
                                        size=(Config.pop_size,))
-    population[:,4] = np.random.normal(loc = 0, scale = 1/3, 
+    population[:,4] = rng.normal(loc = 0, scale = 1/3, 
                                        size=(Config.pop_size,))
 
     #initialize random speeds
-    population[:,5] = np.random.normal(Config.speed, Config.speed / 3)
+    population[:,5] = rng.normal(Config.speed, Config.speed / 3)
 
     #initalize ages
     std_age = (max_age - mean_age) / 3
-    population[:,7] = np.int32(np.random.normal(loc = mean_age, 
+    population[:,7] = np.int32(rng.normal(loc = mean_age, 
                                                 scale = std_age, 
                                                 size=(Config.pop_size,)))
 
@@ -82,7 +86,7 @@ def initialize_population(Config, mean_age=45, max_age=105,
                               a_max = max_age) #clip those younger than 0 years
 
     #build recovery_vector
-    population[:,9] = np.random.normal(loc = 0.5, scale = 0.5 / 3, size=(Config.pop_size,))
+    population[:,9] = rng.normal(loc = 0.5, scale = 0.5 / 3, size=(Config.pop_size,))
 
     return population
 
@@ -109,7 +113,7 @@ def initialize_destination_matrix(pop_size, total_destinations):
 
 
 def set_destination_bounds(population, destinations, xmin, ymin, 
-                           xmax, ymax, dest_no=1, teleport=True):
+                           xmax, ymax, dest_no=1, teleport=True, rng=np.random):
     '''teleports all persons within limits
 
     Function that takes the population and coordinates,
@@ -121,7 +125,7 @@ def set_destination_bounds(population, destinations, xmin, ymin,
     population : ndarray
         the array containing all the population information
 
-    destinations : ndarray
+    destinations : ndarray or Location_registry
         the array containing all the destination information
 
     xmin, ymin, xmax, ymax : int or float
@@ -133,20 +137,26 @@ def set_destination_bounds(population, destinations, xmin, ymin,
 
     teleport : bool
         whether to instantly teleport individuals to the defined locations
+
+    rng : Generator
+        the random number generator to use, defaults to the global numpy random state
     '''
 
     #teleport
     if teleport:
-        population[:,1] = np.random.uniform(low = xmin, high = xmax, size = len(population))
-        population[:,2] = np.random.uniform(low = ymin, high = ymax, size = len(population))
+        population[:,1] = rng.uniform(low = xmin, high = xmax, size = len(population))
+        population[:,2] = rng.uniform(low = ymin, high = ymax, size = len(population))
 
     #get parameters
     x_center, y_center, x_wander, y_wander = get_motion_parameters(xmin, ymin, 
                                                                    xmax, ymax)
 
     #set destination centers
-    destinations[:,(dest_no - 1) * 2] = x_center
-    destinations[:,((dest_no - 1) * 2) + 1] = y_center
+    if isinstance(destinations, Location_registry):
+        destinations.assign(np.arange(len(population)), [xmin, ymin, xmax, ymax], dest_no)
+    else:
+        destinations[:,(dest_no - 1) * 2] = x_center
+        destinations[:,((dest_no - 1) * 2) + 1] = y_center
 
     #set wander bounds
     population[:,13] = x_wander
@@ -220,13 +230,26 @@ class Population_trackers():
         #PLACEHOLDER - whether recovered individual can be reinfected
         self.reinfect = False 
 
-    def update_counts(self, population):
-        '''docstring
+    def update_counts(self, population, state_index=None):
+        '''appends the current number of people in each state
+
+        Keyword arguments
+        -----------------
+        population : ndarray
+            the array containing all the population information
+
+        state_index : State_index
+            if given, counts are taken from the index
         '''
         pop_size = population.shape[0]
-        self.infectious.append(len(population[population[:,6] == 1]))
-        self.recovered.append(len(population[population[:,6] == 2]))
-        self.fatalities.append(len(population[population[:,6] == 3]))
+        if state_index is None:
+            self.infectious.append(np.count_nonzero(population[:,6] == 1))
+            self.recovered.append(np.count_nonzero(population[:,6] == 2))
+            self.fatalities.append(np.count_nonzero(population[:,6] == 3))
+        else:
+            self.infectious.append(state_index.count(6, 1))
+            self.recovered.append(state_index.count(6, 2))
+            self.fatalities.append(state_index.count(6, 3))
 
         if self.reinfect:
             self.susceptible.append(pop_size - (self.infectious[-1] +
@@ -234,4 +257,250 @@ class Population_trackers():
         else:
             self.susceptible.append(pop_size - (self.infectious[-1] +
                                                 self.recovered[-1] +
-                                                self.fatalities[-1]))
\ No newline at end of file
+                                                self.fatalities[-1]))
+
+def set_state(population, indices, column, value, state_index=None):
+    '''sets a column to a value for the given population members
+
+    Writes the value into the population matrix, and keeps the state index
+    up to date if one is given.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+
+    indices : ndarray or list
+        the indices of the population members to update
+
+    column : int
+        the column of the population matrix to set
+
+    value : int or float
+        the new value
+
+    state_index : State_index
+        the state index to update, if used
+    '''
+    if state_index is None:
+        population[:,column][indices] = value
+    else:
+        state_index.set(population, indices, column, value)
+
+
+class State_index():
+    '''keeps the indices of population members for each state
+
+    Tracks which population members have each value in the columns for
+    current state (6), in treatment (10), active destination (11) and
+    at destination (12), so that these subsets can be looked up without
+    testing the whole population. The index is updated incrementally as
+    members change state: only the groups that changed are updated, and
+    only when they are read.
+
+    Changes to these columns must go through set() or set_state() to keep
+    the index up to date. After editing the population directly, call rebuild().
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        the array containing all the population information
+    '''
+    columns = (6, 10, 11, 12)
+
+    def __init__(self, population=None):
+        if population is not None:
+            self.rebuild(population)
+
+    def rebuild(self, population):
+        '''rebuilds the index from the population matrix'''
+        self.values = {}
+        self.groups = {}
+        self.added = {}
+        self.stale = {}
+
+        for column in self.columns:
+            values = np.int64(population[:,column])
+            order = np.argsort(values, kind='stable')
+            unique, starts = np.unique(values[order], return_index=True)
+
+            self.values[column] = values
+            self.groups[column] = {int(v): idx for v, idx in zip(unique, 
+                                                                 np.split(order, starts[1:]))}
+            self.added[column] = {} #members that got the value since the group was last read
+            self.stale[column] = set() #values of groups that members have left since last read
+
+    def get(self, column, value):
+        '''returns the sorted indices of members where column equals value'''
+        value = int(value)
+        group = self.groups[column].get(value, np.zeros((0,), dtype=np.int64))
+
+        if value in self.stale[column]:
+            group = group[self.values[column][group] == value]
+            self.stale[column].discard(value)
+
+        added = self.added[column].pop(value, None)
+        if added is not None:
+            added = np.unique(np.concatenate(added))
+            added = added[self.values[column][added] == value]
+            #skip those that left and came back, they never left the group
+            positions = np.searchsorted(group, added)
+            present = np.zeros((len(added),), dtype=bool)
+            inside = positions < len(group)
+            present[inside] = group[positions[inside]] == added[inside]
+            group = np.insert(group, positions[~present], added[~present])
+
+        self.groups[column][value] = group
+        return group
+
+    def get_not(self, column, value):
+        '''returns the sorted indices of members where column does not equal value'''
+        others = set(self.groups[column]) | set(self.added[column])
+        others.discard(int(value))
+        if len(others) == 0:
+            return np.zeros((0,), dtype=np.int64)
+        return np.sort(np.concatenate([self.get(column, v) for v in others]))
+
+    def count(self, column, value):
+        '''returns the number of members where column equals value'''
+        return len(self.get(column, value))
+
+    def count_not(self, column, value):
+        '''returns the number of members where column does not equal value'''
+        return len(self.values[column]) - self.count(column, value)
+
+    def set(self, population, indices, column, value):
+        '''sets column to value for the given members and updates the index
+
+        Keyword arguments
+        -----------------
+        population : ndarray
+            the array containing all the population information
+
+        indices : ndarray or list
+            the indices of the population members to update
+
+        column : int
+            the column of the population matrix to set
+
+        value : int or float
+            the new value
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        population[:,column][indices] = value
+
+        if column not in self.values or len(indices) == 0:
+            return
+
+        value = int(value)
+        old = self.values[column][indices]
+        changed = old != value
+        if not changed.any():
+            return
+
+        moved = indices[changed]
+        for old_value in np.unique(old[changed]):
+            self.stale[column].add(int(old_value))
+        self.values[column][moved] = value
+        self.added[column].setdefault(value, []).append(moved)
+
+
+class Population_columns():
+    '''population stored as one contiguous array per column
+
+    Holds the same information as the population matrix from initialize_population(),
+    but stores every column as its own array, with compact data types for the
+    discrete fields (IDs, states, ages, flags and destination numbers). Positions,
+    headings, speed and wander ranges can be stored as float32.
+
+    Supports the indexing used on the population matrix throughout the simulation:
+
+    population[:,k] returns the array of column k itself, writes go into the population
+    population[rows,k] and population[rows,a:b] return copies of those values
+    population[rows] returns a float64 copy of the selected rows
+    population[rows] = values writes the rows back into the columns
+
+    Note that population[:,a:b] and population[rows] are copies, so values written
+    into them are not stored, write per column or assign rows back in stead.
+
+    Keyword arguments
+    -----------------
+    pop_size : int
+        the size of the population
+
+    float_dtype : str or dtype
+        the data type of positions, headings, speed and wander ranges,
+        can be 'float64' or 'float32'
+    '''
+    dtypes = ['int32', None, None, None, None, None, 'int8', 'int16',
+              'int32', 'float64', 'int8', 'int16', 'int8', None, None]
+
+    def __init__(self, pop_size, float_dtype='float64'):
+        self.float_dtype = np.dtype(float_dtype)
+        self.columns = [np.zeros((pop_size,), dtype=self.float_dtype if dtype is None else dtype)
+                        for dtype in self.dtypes]
+
+    @classmethod
+    def from_matrix(cls, population, float_dtype='float64'):
+        '''builds the columns from a population matrix'''
+        columns = cls(len(population), float_dtype)
+        for k, column in enumerate(columns.columns):
+            column[:] = population[:,k]
+        return columns
+
+    @property
+    def shape(self):
+        return (len(self.columns[0]), len(self.columns))
+
+    @property
+    def nbytes(self):
+        return sum([column.nbytes for column in self.columns])
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __array__(self, dtype=None, copy=None):
+        return self._stack(slice(None), range(len(self.columns)), dtype)
+
+    def copy(self):
+        population = Population_columns(0, self.float_dtype)
+        population.columns = [column.copy() for column in self.columns]
+        return population
+
+    def _stack(self, rows, columns, dtype=None):
+        '''returns the selected rows and columns as a matrix'''
+        first = self.columns[0][rows]
+        matrix = np.zeros(np.shape(first) + (len(columns),), 
+                          dtype=np.float64 if dtype is None else dtype)
+        for j, k in enumerate(columns):
+            matrix[...,j] = self.columns[k][rows]
+        return matrix
+
+    def _split(self, key):
+        '''splits an index into rows and columns'''
+        if isinstance(key, tuple):
+            rows, columns = key
+        else:
+            rows, columns = key, slice(None)
+
+        if isinstance(columns, (int, np.integer)):
+            return rows, int(columns)
+        return rows, range(len(self.columns))[columns]
+
+    def __getitem__(self, key):
+        rows, columns = self._split(key)
+        if isinstance(columns, int):
+            if isinstance(rows, slice) and rows == slice(None):
+                return self.columns[columns]
+            return self.columns[columns][rows]
+        return self._stack(rows, columns)
+
+    def __setitem__(self, key, values):
+        rows, columns = self._split(key)
+        if isinstance(columns, int):
+            self.columns[columns][rows] = values
+            return
+
+        values = np.asarray(values)
+        for j, k in enumerate(columns):
+            self.columns[k][rows] = values if values.ndim == 0 else values[...,j]
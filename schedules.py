@@ -0,0 +1,147 @@
+'''
+contains the travel schedules that send population members to their
+destinations (home, work, groceries, school, ..) over the course of a day
+'''
+
+import numpy as np
+
+from locations import Location_registry
+from population import set_state
+
+class Travel_schedule():
+    '''daily travel schedule of the population
+
+    Holds for each population member an itinerary of legs, where every leg
+    is a start time (frame modulo the day length) and a destination number.
+    When a leg starts, the destination becomes the active destination
+    (column 11) of the member, who then travels there, and the wander range
+    of the destination is set (columns 13 and 14). Destination number 0
+    means wandering freely.
+
+    With a Location_registry the wander ranges are those of the locations.
+    The destinations matrix only holds the centers of the destinations, so
+    legs to a destination in the matrix need their wander range given
+    with add_legs().
+
+    The legs are stored bucketed by start time, so the members whose leg
+    starts at a frame are a single slice, and are switched at once.
+
+    Members in treatment and the dead do not follow their schedule.
+
+    Keyword arguments
+    -----------------
+    day_length : int
+        the number of frames in a day
+    '''
+    def __init__(self, day_length=100):
+        self.day_length = day_length
+        self.members = np.zeros((0,), dtype=np.int32)
+        self.starts = np.zeros((0,), dtype=np.int32)
+        self.dest_nos = np.zeros((0,), dtype=np.int16)
+        self.wander_ranges = np.zeros((0, 2)) #NaN where not given
+        self.offsets = None #start of each time bucket in the sorted legs
+
+    def __len__(self):
+        return len(self.members)
+
+    def add_legs(self, members, start, dest_no, wander_range=None):
+        '''adds a leg to the itinerary of the given members
+
+        Keyword arguments
+        -----------------
+        members : ndarray
+            the indices of the population members
+
+        start : int or ndarray
+            the time of day (frame modulo day length) the leg starts,
+            the same for all members or one per member
+
+        dest_no : int or ndarray
+            the destination number to travel to, 0 to wander freely,
+            the same for all members or one per member
+
+        wander_range : None, list, tuple or ndarray
+            the x and y wander range at the destination, the same for all
+            members or an array of shape (len(members), 2). Needed for legs
+            to a destination in the destinations matrix
+        '''
+        members = np.asarray(members, dtype=np.int32)
+        start = np.broadcast_to(np.asarray(start, dtype=np.int32) % self.day_length,
+                                members.shape)
+        dest_no = np.broadcast_to(np.asarray(dest_no, dtype=np.int16), members.shape)
+        if wander_range is None:
+            wander_range = np.nan
+        wander_range = np.broadcast_to(np.asarray(wander_range, dtype=np.float64),
+                                       (len(members), 2))
+
+        self.members = np.concatenate([self.members, members])
+        self.starts = np.concatenate([self.starts, start])
+        self.dest_nos = np.concatenate([self.dest_nos, dest_no])
+        self.wander_ranges = np.concatenate([self.wander_ranges, wander_range])
+        self.offsets = None
+
+    def sort(self):
+        '''sorts the legs into buckets per time of day'''
+        order = np.argsort(self.starts, kind='stable')
+        self.members = self.members[order]
+        self.starts = self.starts[order]
+        self.dest_nos = self.dest_nos[order]
+        self.wander_ranges = self.wander_ranges[order]
+        self.offsets = np.searchsorted(self.starts, np.arange(self.day_length + 1))
+
+    def get_legs(self, frame):
+        '''returns the members, destination numbers and wander ranges of the
+        legs starting at frame'''
+        if self.offsets is None:
+            self.sort()
+
+        time = frame % self.day_length
+        legs = slice(self.offsets[time], self.offsets[time + 1])
+        return self.members[legs], self.dest_nos[legs], self.wander_ranges[legs]
+
+    def apply(self, population, frame, destinations=None, state_index=None):
+        '''switches the active destination of those whose leg starts at frame
+
+        Keyword arguments
+        -----------------
+        population : ndarray
+            the array containing all the population information
+
+        frame : int
+            the current frame of the simulation
+
+        destinations : ndarray or Location_registry
+            the destinations information. If a location registry is given,
+            the wander ranges of the members are set to those of their
+            new location, otherwise to those given with the legs
+
+        state_index : State_index
+            if given, kept up to date with the active destinations
+        '''
+        members, dest_nos, wander_ranges = self.get_legs(frame)
+
+        #those in treatment and the dead stay where they are
+        follow = (population[:,10][members] != 1) & (population[:,6][members] != 3)
+        members = np.int64(members[follow])
+        dest_nos = dest_nos[follow]
+
+        if len(members) == 0:
+            return population
+
+        traveling = dest_nos != 0
+        if isinstance(destinations, Location_registry):
+            locations = destinations.ids[members[traveling], dest_nos[traveling] - 1]
+            wander_ranges = destinations.wander_ranges[locations]
+        else:
+            wander_ranges = wander_ranges[follow][traveling]
+            if np.isnan(wander_ranges).any():
+                raise ValueError('legs to a destination in the destinations matrix need a \
+wander_range, see Travel_schedule.add_legs()')
+        population[:,13][members[traveling]] = wander_ranges[:,0]
+        population[:,14][members[traveling]] = wander_ranges[:,1]
+
+        for dest_no in np.unique(dest_nos):
+            set_state(population, members[dest_nos == dest_no], 11, dest_no, state_index)
+        set_state(population, members, 12, 0, state_index) #set as traveling
+
+        return population
@@ -2,24 +2,77 @@ import os
 import sys
 
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 
+from checkpoint import save_checkpoint, load_checkpoint
 from config import Configuration, config_error
 from environment import build_hospital
 from infection import find_nearby, infect, recover_or_die, compute_mortality,\
-healthcare_infection_correction
+healthcare_infection_correction, Recovery_calendar
+from locations import Location_registry
 from motion import update_positions, out_of_bounds, update_randoms,\
-get_motion_parameters
+get_motion_parameters, motion_step, Motion_buffers
+from neighbours import Verlet_list
+import numba_engine
+from numba_engine import use_numba
 from path_planning import go_to_location, set_destination, check_at_destination,\
-keep_at_destination, reset_destinations
+keep_at_destination, reset_destinations, release_recovered
 from population import initialize_population, initialize_destination_matrix,\
-set_destination_bounds, save_data, save_population, Population_trackers
-from visualiser import build_fig, draw_tstep, set_style, plot_sir
+set_destination_bounds, save_data, save_population, Population_trackers,\
+State_index, Population_columns
+from schedules import Travel_schedule
+from utils import get_rng, Interrupt_flag
 
-#set seed for reproducibility
+#set seed for reproducibility, or pass seed to Simulation to give it its own random stream
 #np.random.seed(100)
 
+class Step_plan():
+    '''the settings of a time step that stay the same from step to step
+
+    Made from the configuration once for many steps (see Simulation.step_n()),
+    so a step does not look them up again every frame. Holds whether the
+    compiled kernels are used, the roaming bounds, the lockdown threshold,
+    the highest number of infected so far, the functions and frequencies
+    of drawing, reporting and saving, and when callback() acts: every
+    frame if callback() is overridden without next_event(), otherwise at
+    the frame next_event() returns.
+
+    Keyword arguments
+    -----------------
+    sim : Simulation
+        the simulation to make the plan for
+    '''
+    def __init__(self, sim):
+        Config = sim.Config
+
+        #check whether the compiled kernels are used
+        self.numba_active = use_numba(Config.engine)
+
+        #define bounds, excluding those who are marked as having a custom destination
+        self.xbounds = [Config.xbounds[0] + 0.02, Config.xbounds[1] - 0.02]
+        self.ybounds = [Config.ybounds[0] + 0.02, Config.ybounds[1] - 0.02]
+
+        #lockdown starts once the number of infected reaches the threshold, the
+        #highest number so far is kept up to date by the steps taken with this plan
+        self.lockdown_threshold = None
+        self.peak_infectious = 0
+        if Config.lockdown:
+            self.lockdown_threshold = len(sim.population) * Config.lockdown_percentage
+            if len(sim.pop_tracker.infectious) > 0:
+                self.peak_infectious = np.max(sim.pop_tracker.infectious)
+
+        self.draw = None
+        if Config.visualise:
+            from visualiser import draw_tstep
+            self.draw = draw_tstep
+
+        self.report_freq = Config.report_freq
+        self.save_pop_freq = Config.save_pop_freq if Config.save_pop else 0
+
+        self.callback_always = type(sim).callback is not Simulation.callback and\
+                               type(sim).next_event is Simulation.next_event
+        self.callback_frame = sim.next_event()
+
+
 class Simulation():
     #TODO: if lockdown or otherwise stopped: destination -1 means no motion
     def __init__(self, *args, **kwargs):
@@ -27,29 +80,68 @@ class Simulation():
         self.Config = Configuration(*args, **kwargs)
         self.frame = 0
 
+        #random number generator of this simulation, the global numpy one if no seed is set
+        self.rng = get_rng(self.Config.seed)
+
         #initialize default population
         self.population_init()
 
         self.pop_tracker = Population_trackers()
 
+        #initialise calendar of when illnesses resolve
+        self.calendar = Recovery_calendar()
+
+        #initialise list of candidate infection pairs, used if neighbour_method is 'verlet'
+        self.neighbour_list = Verlet_list(self.Config.verlet_skin)
+
+        #initialise scratch arrays used in moving the population
+        self.motion_buffers = Motion_buffers(self.Config.pop_size)
+
         #initalise destinations vector
-        self.destinations = initialize_destination_matrix(self.Config.pop_size, 1)        
+        self.destinations_init()
+
+        #daily travel schedule, set a Travel_schedule here to have people travel
+        self.schedule = None
 
 
     def reinitialise(self):
         '''reset the simulation'''
         
         self.frame = 0
+        self.rng = get_rng(self.Config.seed)
         self.population_init()
         self.pop_tracker = Population_trackers()
-        self.destinations = initialize_destination_matrix(self.Config.pop_size, 1)
+        self.calendar = Recovery_calendar()
+        self.neighbour_list = Verlet_list(self.Config.verlet_skin)
+        self.motion_buffers = Motion_buffers(self.Config.pop_size)
+        self.destinations_init()
 
 
     def population_init(self):
         '''(re-)initializes population'''
         self.population = initialize_population(self.Config, self.Config.mean_age, 
                                                 self.Config.max_age, self.Config.xbounds, 
-                                                self.Config.ybounds)
+                                                self.Config.ybounds, self.rng)
+
+        if self.Config.population_layout == 'columns':
+            self.population = Population_columns.from_matrix(self.population, 
+                                                             self.Config.float_dtype)
+        elif self.Config.population_layout != 'matrix':
+            raise ValueError('population_layout %s not understood! Must be matrix or columns'
+                             %self.Config.population_layout)
+
+        #index of who is in which state, kept up to date during the simulation
+        self.state_index = State_index(self.population)
+
+
+    def destinations_init(self):
+        '''(re-)initializes destinations, as matrix or as location registry'''
+        if self.Config.location_registry:
+            self.destinations = Location_registry(self.Config.pop_size, 
+                                                  self.Config.total_destinations)
+        else:
+            self.destinations = initialize_destination_matrix(self.Config.pop_size, 
+                                                             self.Config.total_destinations)
 
 
     def tstep(self):
@@ -58,149 +150,449 @@ class Simulation():
         '''
         
         if self.frame == 0 and self.Config.visualise:
-            #initialize figure
+            #initialize figure, matplotlib is only imported when visualising
+            from visualiser import build_fig
             self.fig, self.spec, self.ax1, self.ax2 = build_fig(self.Config)
 
+        if self.frame == 0:
+            #pick up any changes made to the population before the first step
+            self.state_index.rebuild(self.population)
+
+        if self.frame == 0 and use_numba(self.Config.engine):
+            if isinstance(self.rng, np.random.Generator):
+                numba_engine.seed(self.rng.integers(0, 2**31))
+            else:
+                numba_engine.seed(self.rng.randint(0, 2**31))
+
+        self.take_step(Step_plan(self))
+
+
+    def take_step(self, plan):
+        '''takes a time step following a step plan
+
+        Returns whether callback() was called, after which the plan is out of
+        date, as the callback may have changed the configuration.
+
+        Keyword arguments
+        -----------------
+        plan : Step_plan
+            the settings of the step, made once for many steps by step_n()
+        '''
+
+        #move everyone
+        self.move(plan)
+
+        #find new infections
+        self.population, self.destinations = infect(self.population, self.Config, self.frame, 
+                                                    send_to_location = self.Config.self_isolate, 
+                                                    location_bounds = self.Config.isolation_bounds,  
+                                                    destinations = self.destinations, 
+                                                    location_no = 1, 
+                                                    location_odds = self.Config.self_isolate_proportion,
+                                                    calendar = self.calendar,
+                                                    neighbour_list = self.neighbour_list,
+                                                    state_index = self.state_index,
+                                                    rng = self.rng)
+
+        #recover and die
+        self.population = recover_or_die(self.population, self.frame, self.Config,
+                                         calendar = self.calendar,
+                                         state_index = self.state_index,
+                                         rng = self.rng)
+
+        self.finish_frame(plan)
+
+        #update population statistics
+        self.pop_tracker.update_counts(self.population, self.state_index)
+        plan.peak_infectious = max(plan.peak_infectious, self.pop_tracker.infectious[-1])
+
+        #visualise
+        if plan.draw is not None:
+            plan.draw(self.Config, self.population, self.pop_tracker, self.frame, 
+                      self.fig, self.spec, self.ax1, self.ax2, self.state_index)
+
+        #report stuff to console
+        if plan.report_freq > 0 and (self.frame % plan.report_freq) == 0:
+            self.report(self.frame)
+
+        #run callback
+        called = plan.callback_always or self.frame == plan.callback_frame
+        if called:
+            self.callback()
+
+        #update frame
+        self.frame += 1
+        return called
+
+
+    def step_n(self, n):
+        '''advances the simulation n frames
+
+        Takes the same steps as calling tstep() n times, but decides once
+        which parts of a step are active (see Step_plan), rather than every
+        frame. The status line, saving the population and callback() only
+        run at the frames they are due. Frames in which nobody is infectious
+        are fast forwarded if Config.fast_forward is set, as in run().
+
+        The plan is made again after every call of callback(), so changes it
+        makes to the configuration are picked up. Other changes to the
+        configuration take effect from the next call of step_n().
+
+        Keyword arguments
+        -----------------
+        n : int
+            the number of frames to advance
+
+        Returns the frame the simulation is at.
+        '''
+        end = self.frame + n
+        plan = None
+        while self.frame < end:
+            plan = self.advance(end, plan)
+        return self.frame
+
+
+    def advance(self, end, plan=None):
+        '''takes the next time step, or fast forwards the idle frames before end
+
+        Returns the step plan to pass to the next call, None if it needs to
+        be made again.
+
+        Keyword arguments
+        -----------------
+        end : int
+            the frame to stop fast forwarding at
+
+        plan : Step_plan
+            the plan returned by the previous call, None to make a new one
+        '''
+        #only move the population in frames where nobody is infectious
+        frames = min(self.idle_frames(), end - self.frame)
+        if frames > 0:
+            self.fast_forward(frames)
+            return plan
+
+        if self.frame == 0:
+            #first step sets up figure, index and compiled kernels
+            self.tstep()
+            return None
+
+        if plan is None:
+            plan = Step_plan(self)
+        if self.take_step(plan):
+            return None
+        return plan
+
+
+    def move(self, plan=None):
+        '''moves the population one time step
+
+        Starts the legs of the travel schedule, moves those with a destination
+        and wanders everyone else around, taking lockdown into account.
+
+        Keyword arguments
+        -----------------
+        plan : Step_plan
+            the settings of the step, made from the configuration if not given
+        '''
+        if plan is None:
+            plan = Step_plan(self)
+        numba_active = plan.numba_active
+
+        #start the legs of the travel schedule that start this frame
+        if self.schedule is not None:
+            self.population = self.schedule.apply(self.population, self.frame, 
+                                                  self.destinations, self.state_index)
+
         #check destinations if active
         #define motion vectors if destinations active and not everybody is at destination
-        active_dests = len(self.population[self.population[:,11] != 0]) # look op this only once
+        active_dests = self.state_index.count_not(11, 0) # look op this only once
 
-        if active_dests > 0 and len(self.population[self.population[:,12] == 0]) > 0:
-            self.population = set_destination(self.population, self.destinations)
+        if active_dests > 0 and self.state_index.count(12, 0) > 0:
+            self.population = set_destination(self.population, self.destinations, self.state_index)
             self.population = check_at_destination(self.population, self.destinations, 
                                                    wander_factor = self.Config.wander_factor_dest,
-                                                   speed = self.Config.speed)
+                                                   speed = self.Config.speed,
+                                                   state_index = self.state_index,
+                                                   rng = self.rng)
 
-        if active_dests > 0 and len(self.population[self.population[:,12] == 1]) > 0:
+        if active_dests > 0 and self.state_index.count(12, 1) > 0:
             #keep them at destination
-            self.population = keep_at_destination(self.population, self.destinations,
-                                                  self.Config.wander_factor)
-
-        #out of bounds
-        #define bounds arrays, excluding those who are marked as having a custom destination
-        if len(self.population[:,11] == 0) > 0:
-            _xbounds = np.array([[self.Config.xbounds[0] + 0.02, self.Config.xbounds[1] - 0.02]] * len(self.population[self.population[:,11] == 0]))
-            _ybounds = np.array([[self.Config.ybounds[0] + 0.02, self.Config.ybounds[1] - 0.02]] * len(self.population[self.population[:,11] == 0]))
-            self.population[self.population[:,11] == 0] = out_of_bounds(self.population[self.population[:,11] == 0], 
-                                                                        _xbounds, _ybounds)
-        
-        #set randoms
-        if self.Config.lockdown:
-            if len(self.pop_tracker.infectious) == 0:
-                mx = 0
+            if numba_active:
+                self.population = numba_engine.keep_at_destination(self.population, self.destinations,
+                                                                   self.Config.wander_factor)
             else:
-                mx = np.max(self.pop_tracker.infectious)
-
-            if len(self.population[self.population[:,6] == 1]) >= len(self.population) * self.Config.lockdown_percentage or\
-               mx >= (len(self.population) * self.Config.lockdown_percentage):
+                self.population = keep_at_destination(self.population, self.destinations,
+                                                      self.Config.wander_factor, self.state_index,
+                                                      self.rng)
+
+        #bounds, excluding those who are marked as having a custom destination
+        _xbounds = plan.xbounds
+        _ybounds = plan.ybounds
+
+        #check whether lockdown is active
+        lockdown_vector = None
+        if plan.lockdown_threshold is not None:
+            if self.state_index.count(6, 1) >= plan.lockdown_threshold or\
+               plan.peak_infectious >= plan.lockdown_threshold:
+                lockdown_vector = self.Config.lockdown_vector
+
+        if numba_active:
+            #out of bounds
+            self.population = numba_engine.out_of_bounds(self.population, _xbounds, _ybounds)
+
+            if lockdown_vector is not None:
                 #reduce speed of all members of society
                 self.population[:,5] = np.clip(self.population[:,5], a_min = None, a_max = 0.001)
                 #set speeds of complying people to 0
-                self.population[:,5][self.Config.lockdown_vector == 0] = 0
+                self.population[:,5][lockdown_vector == 0] = 0
             else:
                 #update randoms
-                self.population = update_randoms(self.population, self.Config.pop_size, self.Config.speed)
+                self.population = numba_engine.update_randoms(self.population, self.Config.pop_size,
+                                                              self.Config.speed)
+
+            #for dead ones: set speed and heading to 0
+            dead = self.state_index.get(6, 3)
+            self.population[:,3][dead] = 0
+            self.population[:,4][dead] = 0
+
+            #update positions
+            self.population = numba_engine.update_positions(self.population)
         else:
-            #update randoms
-            self.population = update_randoms(self.population, self.Config.pop_size, self.Config.speed)
+            #out of bounds, update randoms and positions in one pass
+            self.population, self.motion_buffers = motion_step(self.population, _xbounds, _ybounds,
+                                                               self.Config.speed, self.motion_buffers,
+                                                               lockdown_vector, 
+                                                               state_index = self.state_index,
+                                                               rng = self.rng)
 
-        #for dead ones: set speed and heading to 0
-        self.population[:,3:5][self.population[:,6] == 3] = 0
-        
-        #update positions
-        self.population = update_positions(self.population)
 
-        #find new infections
-        self.population, self.destinations = infect(self.population, self.Config, self.frame, 
-                                                    send_to_location = self.Config.self_isolate, 
-                                                    location_bounds = self.Config.isolation_bounds,  
-                                                    destinations = self.destinations, 
-                                                    location_no = 1, 
-                                                    location_odds = self.Config.self_isolate_proportion)
+    def finish_frame(self, plan):
+        '''does the bookkeeping of a frame that follows the infections and recoveries
 
-        #recover and die
-        self.population = recover_or_die(self.population, self.frame, self.Config)
+        Sends those who recovered in self isolation back to the population,
+        and saves the population if due. Called by take_step() and for every
+        frame by fast_forward(), so fast forwarded frames end the same.
 
+        Keyword arguments
+        -----------------
+        plan : Step_plan
+            the settings of the step
+        '''
         #send cured back to population if self isolation active
-        #perhaps put in recover or die class
-        #send cured back to population
-        self.population[:,11][self.population[:,6] == 2] = 0
+        if self.Config.self_isolate:
+            release_recovered(self.population, 1, self.state_index)
 
-        #update population statistics
-        self.pop_tracker.update_counts(self.population)
+        #save popdata if required
+        if plan.save_pop_freq > 0 and (self.frame % plan.save_pop_freq) == 0:
+            save_population(self.population, self.frame, self.Config.save_pop_folder)
 
-        #visualise
-        if self.Config.visualise:
-            draw_tstep(self.Config, self.population, self.pop_tracker, self.frame, 
-                       self.fig, self.spec, self.ax1, self.ax2)
 
-        #report stuff to console
+    def report(self, frame):
+        '''writes the status line of frame to the console, after its statistics are tracked'''
         sys.stdout.write('\r')
         sys.stdout.write('%i: healthy: %i, infected: %i, immune: %i, in treatment: %i, \
-dead: %i, of total: %i' %(self.frame, self.pop_tracker.susceptible[-1], self.pop_tracker.infectious[-1],
-                        self.pop_tracker.recovered[-1], len(self.population[self.population[:,10] == 1]),
-                        self.pop_tracker.fatalities[-1], self.Config.pop_size))
+dead: %i, of total: %i' %(frame, self.pop_tracker.susceptible[-1], self.pop_tracker.infectious[-1],
+                            self.pop_tracker.recovered[-1], self.state_index.count(10, 1),
+                            self.pop_tracker.fatalities[-1], self.Config.pop_size))
 
-        #save popdata if required
-        if self.Config.save_pop and (self.frame % self.Config.save_pop_freq) == 0:
-            save_population(self.population, self.frame, self.Config.save_pop_folder)
-        #run callback
-        self.callback()
 
-        #update frame
-        self.frame += 1
+    def idle_frames(self):
+        '''returns the number of frames from now in which only motion happens
+
+        Frames are idle while nobody is infectious: nobody can get infected,
+        recover or die, and the population statistics stay the same. The
+        idle frames run up to the next frame at which callback() acts (see
+        next_event()), the end of the run or the next checkpoint. Returns 0
+        if Config.fast_forward is off, when visualising, or if callback()
+        is overridden without overriding next_event().
+        '''
+        if not self.Config.fast_forward or self.Config.visualise or self.frame == 0:
+            return 0
+
+        if type(self).callback is not Simulation.callback and\
+           type(self).next_event is Simulation.next_event:
+            return 0
+
+        if self.state_index.count(6, 1) + self.state_index.count(6, 4) > 0:
+            return 0
+
+        end = self.Config.simulation_steps
+
+        event = self.next_event()
+        if event is not None:
+            end = min(end, event)
+
+        if self.Config.endif_no_infections:
+            #run() stops at the first frame from 500 without infections
+            end = min(end, max(500, self.frame + 1))
+
+        if self.Config.checkpoint_path is not None and self.Config.checkpoint_freq > 0:
+            end = min(end, ((self.frame // self.Config.checkpoint_freq) + 1) * self.Config.checkpoint_freq)
+
+        return max(end - self.frame, 0)
+
+
+    def fast_forward(self, frames):
+        '''advances idle frames, only moving the population
+
+        Takes the same steps as tstep() would for frames in which nobody is
+        infectious (see idle_frames()): moves the population and finishes
+        the frame with finish_frame(), but skips looking for infections,
+        recoveries and deaths, fills the population trackers at once and
+        writes the status line only for the last frame. With neighbour_method
+        'verlet' the neighbour list is rebuilt after fast forwarding.
+
+        Keyword arguments
+        -----------------
+        frames : int
+            the number of frames to advance, at most idle_frames()
+        '''
+        if frames <= 0:
+            return
+
+        #nobody gets infected, so whether lockdown is active stays the same
+        plan = Step_plan(self)
+
+        for i in range(frames):
+            self.move(plan)
+            self.finish_frame(plan)
+            self.frame += 1
+
+        #nobody changed state, so the statistics are the same every frame
+        self.pop_tracker.update_counts(self.population, self.state_index)
+        for counts in (self.pop_tracker.susceptible, self.pop_tracker.infectious,
+                       self.pop_tracker.recovered, self.pop_tracker.fatalities):
+            counts.extend([counts[-1]] * (frames - 1))
+
+        self.neighbour_list.positions = None
+
+        if self.Config.report_freq > 0:
+            self.report(self.frame - 1)
 
 
     def callback(self):
         '''placeholder function that can be overwritten.
 
         By ovewriting this method any custom behaviour can be implemented.
-        The method is called after every simulation timestep.
+        The method is called after every simulation timestep, or if
+        next_event() is overridden as well, after the timesteps of the
+        frames it returns.
+
+        People infected here need to be added to self.calendar, so that
+        their illness resolves. Changes to the state, treatment and destination
+        columns need to go through self.state_index.
         '''
 
         if self.frame == 50:
             print('\ninfecting patient zero')
-            self.population[0][6] = 1
-            self.population[0][8] = 50
-            self.population[0][10] = 1
+            self.state_index.set(self.population, [0], 6, 1)
+            self.population[:,8][0] = 50
+            self.state_index.set(self.population, [0], 10, 1)
+            self.calendar.schedule(self.population, [0], self.Config)
+
+
+    def next_event(self):
+        '''returns the next frame at which callback() acts, None if it never does
+
+        Used to fast forward over idle frames (see idle_frames()) and to only
+        call callback() at the frames it acts (see Step_plan), override along
+        with callback().
+        '''
+        if self.frame <= 50:
+            return 50
+        return None
 
 
     def run(self):
-        '''run simulation'''
+        '''run simulation
 
-        i = 0
-        
-        while i < self.Config.simulation_steps:
-            try:
-                self.tstep()
-            except KeyboardInterrupt:
-                print('\nCTRL-C caught, exiting')
-                sys.exit(1)
-
-            #check whether to end if no infecious persons remain.
-            #check if self.frame is above some threshold to prevent early breaking when simulation
-            #starts initially with no infections.
-            if self.Config.endif_no_infections and self.frame >= 500:
-                if len(self.population[(self.population[:,6] == 1) | 
-                                       (self.population[:,6] == 4)]) == 0:
-                    i = self.Config.simulation_steps
+        Runs until Config.simulation_steps frames are taken, so a simulation
+        restored from a checkpoint runs the remaining steps. CTRL-C stops the
+        run after the current step, and writes a checkpoint if
+        Config.checkpoint_path is set.
+        '''
+
+        plan = None
+        with Interrupt_flag() as interrupt:
+            while self.frame < self.Config.simulation_steps:
+                plan = self.advance(self.Config.simulation_steps, plan)
+
+                #write checkpoint if required
+                if self.Config.checkpoint_path is not None and self.Config.checkpoint_freq > 0 and\
+                   (self.frame % self.Config.checkpoint_freq) == 0:
+                    self.checkpoint(self.Config.checkpoint_path)
+
+                if interrupt.caught:
+                    print('\nCTRL-C caught, stopping')
+                    if self.Config.checkpoint_path is not None:
+                        self.checkpoint(self.Config.checkpoint_path)
+                        print('checkpoint written to %s' %self.Config.checkpoint_path)
+                    break
+
+                #check whether to end if no infecious persons remain.
+                #check if self.frame is above some threshold to prevent early breaking when simulation
+                #starts initially with no infections.
+                if self.Config.endif_no_infections and self.frame >= 500:
+                    if self.state_index.count(6, 1) + self.state_index.count(6, 4) == 0:
+                        break
 
         if self.Config.save_data:
             save_data(self.population, self.pop_tracker)
 
         #report outcomes
+        summary = self.summary()
         print('\n-----stopping-----\n')
-        print('total timesteps taken: %i' %self.frame)
-        print('total dead: %i' %len(self.population[self.population[:,6] == 3]))
-        print('total recovered: %i' %len(self.population[self.population[:,6] == 2]))
-        print('total infected: %i' %len(self.population[self.population[:,6] == 1]))
-        print('total infectious: %i' %len(self.population[(self.population[:,6] == 1) |
-                                                          (self.population[:,6] == 4)]))
-        print('total unaffected: %i' %len(self.population[self.population[:,6] == 0]))
+        print('total timesteps taken: %i' %summary['frames'])
+        print('total dead: %i' %summary['dead'])
+        print('total recovered: %i' %summary['recovered'])
+        print('total infected: %i' %summary['infected'])
+        print('total infectious: %i' %summary['infectious'])
+        print('total unaffected: %i' %summary['unaffected'])
+
+
+    def checkpoint(self, path):
+        '''writes the full state of the simulation to path, see checkpoint.py
+
+        The file is replaced atomically, so an interrupted write leaves
+        the previous checkpoint intact.
+        '''
+        save_checkpoint(self, path)
+
+
+    def restore(self, path):
+        '''sets the simulation to the state stored in path by checkpoint()
+
+        The configuration is replaced by the stored one. Call run() to
+        resume, or tstep() to continue step by step.
+        '''
+        load_checkpoint(self, path)
+
+        if self.Config.visualise:
+            #figure is otherwise only built at frame 0
+            from visualiser import build_fig
+            self.fig, self.spec, self.ax1, self.ax2 = build_fig(self.Config)
+
+
+    def summary(self):
+        '''returns the outcome of the simulation so far as a dictionary'''
+        infectious = self.pop_tracker.infectious
+
+        return {'frames': self.frame,
+                'pop_size': self.Config.pop_size,
+                'dead': self.state_index.count(6, 3),
+                'recovered': self.state_index.count(6, 2),
+                'infected': self.state_index.count(6, 1),
+                'infectious': self.state_index.count(6, 1) + self.state_index.count(6, 4),
+                'unaffected': self.state_index.count(6, 0),
+                'in_treatment': self.state_index.count(10, 1),
+                'peak_infectious': int(np.max(infectious)) if len(infectious) > 0 else 0,
+                'peak_frame': int(np.argmax(infectious)) if len(infectious) > 0 else 0}
         
 
     def plot_sir(self, size=(6,3), include_fatalities=False, 
                  title='S-I-R plot of simulation'):
+        from visualiser import plot_sir
         plot_sir(self.Config, self.pop_tracker, size, include_fatalities,
                  title)
 
@@ -235,5 +627,6 @@ if __name__ == '__main__':
     #                              traveling_infects=False)
     #sim.population_init() #reinitialize population to enforce new roaming bounds
 
-    #run, hold CTRL+C in terminal to end scenario early
+    #run, press CTRL+C in terminal to end scenario early, set sim.Config.checkpoint_path
+    #to write a checkpoint that sim.restore() can resume from
     sim.run()
\ No newline at end of file
@@ -0,0 +1,510 @@
+'''
+contains functions to run simulations without visualisation, either one
+at a time, as a sweep over a grid of configuration values in parallel, or
+as scenarios branched from a shared warm-up
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from itertools import product
+import multiprocessing
+import multiprocessing.connection
+import os
+
+import numpy as np
+
+from ensemble import Ensemble
+import numba_engine
+from simulation import Simulation
+from utils import check_folder, get_rng, spawn_seeds
+
+scenarios = ['none', 'lockdown', 'self_isolation', 'reduced_interaction']
+
+#the self-isolation studies in data/, over the proportion of people that comply,
+#for 2000 people on a 1x1, 1.5x1.5 and 2x2 area
+isolation_proportions = [0.99, 0.95, 0.9, 0.8, 0.7, 0.6, 0.5, 0.25, 0.0]
+density_studies = {'high_density': {'xbounds': [0.1, 1.1], 'ybounds': [0.02, 0.98]},
+                   'medium_density': {'xbounds': [0.1, 1.6], 'ybounds': [0.02, 1.48]},
+                   'low_density': {'xbounds': [0.1, 2.1], 'ybounds': [0.02, 1.98]}}
+
+
+def build_simulation(config={}, scenario=None, replicas=None):
+    '''sets up a simulation without visualisation
+
+    Keyword arguments
+    -----------------
+    config : dict
+        Configuration values to set, visualisation and the status line
+        are off and fast forwarding over idle frames is on, unless set here
+
+    scenario : str
+        the scenario to set: 'none', 'lockdown', 'self_isolation' or
+        'reduced_interaction'. The scenario settings are taken from config
+        if given there (for example lockdown_compliance), or the defaults
+        of the scenario otherwise.
+
+    replicas : int
+        if given, sets up an Ensemble of this many replicas in stead
+    '''
+    config = dict(config)
+    config.setdefault('visualise', False)
+    config.setdefault('verbose', False)
+    config.setdefault('report_freq', 0)
+    config.setdefault('fast_forward', True)
+
+    if replicas is None:
+        sim = Simulation(**config)
+    else:
+        sim = Ensemble(replicas, **config)
+
+    apply_scenario(sim, scenario, config)
+    return sim
+
+
+def apply_scenario(sim, scenario=None, config={}, reinitialise=True):
+    '''sets a scenario on a simulation, see build_simulation()
+
+    Keyword arguments
+    -----------------
+    sim : Simulation or Ensemble
+        the simulation to set the scenario on
+
+    scenario : str
+        the scenario to set: 'none', 'lockdown', 'self_isolation' or
+        'reduced_interaction'
+
+    config : dict
+        Configuration values, the scenario settings and world bounds are
+        taken from here if given
+
+    reinitialise : bool
+        whether to reinitialise the population where the scenario changes
+        the roaming bounds or speed. If False, the population keeps its
+        state, and moves into the new bounds or to the new speed over time
+    '''
+    if scenario is None:
+        scenario = 'none'
+    if scenario not in scenarios:
+        raise ValueError('scenario %s not understood! Must be one of %s'
+                         %(scenario, ', '.join(scenarios)))
+
+    def given(*keys):
+        return {key: config[key] for key in keys if key in config}
+
+    if scenario == 'lockdown':
+        sim.Config.set_lockdown(rng = sim.rng, **given('lockdown_percentage',
+                                                       'lockdown_compliance'))
+    elif scenario == 'self_isolation':
+        sim.Config.set_self_isolation(**given('self_isolate_proportion', 'isolation_bounds',
+                                              'traveling_infects'))
+        if reinitialise:
+            sim.population_init() #reinitialize population to enforce new roaming bounds
+    elif scenario == 'reduced_interaction':
+        sim.Config.set_reduced_interaction(**given('speed'))
+        if reinitialise:
+            sim.population_init()
+
+    #world bounds given in config take precedence over those of the scenario
+    bounds = given('xbounds', 'ybounds', 'x_plot', 'y_plot')
+    if len(bounds) > 0:
+        for key, value in bounds.items():
+            sim.Config.set(key, value)
+        if reinitialise:
+            sim.population_init()
+
+
+def run_simulation(config={}, scenario=None, curves=False):
+    '''runs a simulation without visualisation and returns its summary
+
+    Anything the simulation prints is discarded.
+
+    Keyword arguments
+    -----------------
+    config : dict
+        Configuration values to set, see build_simulation()
+
+    scenario : str
+        the scenario to set, see build_simulation()
+
+    curves : bool
+        whether to add the number of infectious people and fatalities
+        per frame to the summary, as 'curves'
+    '''
+    sim = build_simulation(config, scenario)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        sim.run()
+
+    summary = sim.summary()
+    if curves:
+        summary['curves'] = {'infectious': np.asarray(sim.pop_tracker.infectious),
+                             'fatalities': np.asarray(sim.pop_tracker.fatalities)}
+    return summary
+
+
+def run_ensemble(config={}, scenario=None, replicas=10, curves=False):
+    '''runs replicas of a simulation as one Ensemble, returns their summaries
+
+    Anything the ensemble prints is discarded.
+
+    Keyword arguments
+    -----------------
+    config : dict
+        Configuration values to set, see build_simulation()
+
+    scenario : str
+        the scenario to set, see build_simulation()
+
+    replicas : int
+        the number of replicas
+
+    curves : bool
+        whether to add the number of infectious people and fatalities
+        per frame to the summaries, as 'curves'
+    '''
+    ensemble = build_simulation(config, scenario, replicas)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        ensemble.run()
+
+    summaries = ensemble.summaries()
+    if curves:
+        for summary, tracker in zip(summaries, ensemble.pop_trackers):
+            summary['curves'] = {'infectious': np.asarray(tracker.infectious),
+                                 'fatalities': np.asarray(tracker.fatalities)}
+    return summaries
+
+
+def expand_grid(grid):
+    '''returns all combinations of the values in grid
+
+    Keyword arguments
+    -----------------
+    grid : dict
+        for each Configuration key the list of values to try
+
+    Returns
+    -------
+    settings : list
+        a dictionary of Configuration values per combination
+    '''
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in product(*[grid[key] for key in keys])]
+
+
+def run_sweep(grid, config={}, scenario=None, replicas=1, workers=None, seed=None,
+              curves=False, ensemble=False):
+    '''runs simulations for all combinations of the values in grid, in parallel
+
+    Every combination is run 'replicas' times. Each run gets its own random
+    stream, spawned from seed, so a sweep with a seed is reproducible
+    regardless of the number of workers.
+
+    Keyword arguments
+    -----------------
+    grid : dict
+        for each Configuration key the list of values to try
+
+    config : dict
+        Configuration values shared by all runs
+
+    scenario : str
+        the scenario to set, see build_simulation()
+
+    replicas : int
+        the number of runs per combination
+
+    workers : int
+        the number of worker processes, defaults to the number of processors
+
+    seed : int or SeedSequence
+        the seed to spawn the seeds of the runs from, fresh entropy if None
+
+    curves : bool
+        whether to add the number of infectious people and fatalities per
+        frame to the results, needed for save_sweep()
+
+    ensemble : bool
+        whether to run the replicas of each combination together as one
+        Ensemble, which is faster for small populations. Each combination
+        then gets one seed, that the ensemble spawns a random stream per
+        replica from, and runs for as long as its longest replica
+
+    Returns
+    -------
+    results : list
+        per run the Configuration values of the combination, the replica
+        number and the summary of the simulation
+    '''
+    if ensemble:
+        settings = expand_grid(grid)
+        seeds = spawn_seeds(seed, len(settings))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_ensemble, dict(config, seed=run_seed, **setting),
+                                   scenario, replicas, curves)
+                       for setting, run_seed in zip(settings, seeds)]
+
+            results = []
+            for setting, future in zip(settings, futures):
+                for replica, summary in enumerate(future.result()):
+                    results.append(dict(parameters=setting, replica=replica, **summary))
+
+        return results
+
+    runs = [(setting, replica) for setting in expand_grid(grid)
+            for replica in range(replicas)]
+    seeds = spawn_seeds(seed, len(runs))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_simulation, dict(config, seed=run_seed, **setting), 
+                               scenario, curves)
+                   for (setting, replica), run_seed in zip(runs, seeds)]
+
+        results = []
+        for (setting, replica), future in zip(runs, futures):
+            results.append(dict(parameters=setting, replica=replica, **future.result()))
+
+    return results
+
+
+def zero_pad(data):
+    '''stacks arrays of different lengths into a matrix, padded with zeros'''
+    padded = np.zeros((len(data), max([len(d) for d in data])))
+    for i, d in enumerate(data):
+        padded[i, 0:len(d)] = d
+    return padded
+
+
+def format_label(parameters):
+    '''returns the label of a combination of parameter values in file names
+
+    Numbers are written as floats, so that 1, 1.0 and np.float32(1) share a
+    label, and 0.0 gives '0.0' like the file names of the studies in data/.
+    '''
+    values = []
+    for value in parameters.values():
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+            value = float(value)
+        values.append(str(value))
+    return '_'.join(values)
+
+
+def save_sweep(results, folder):
+    '''writes the results of a sweep to disk
+
+    Uses the layout of the studies in data/: per combination of values the
+    mean number of infectious people and fatalities per frame over all
+    replicas, as '<value>_infected.npy' and '<value>_fatalities.npy' in folder,
+    and a summary CSV (folder + '.csv') with per combination the mean, median,
+    max and min over replicas of the average number over time. Curves of an
+    earlier sweep in folder are removed first.
+
+    Keyword arguments
+    -----------------
+    results : list
+        the results of run_sweep(), run with curves = True
+
+    folder : str
+        the folder to write the arrays to
+    '''
+    check_folder(folder)
+    for name in os.listdir(folder):
+        if name.endswith('_infected.npy') or name.endswith('_fatalities.npy'):
+            os.remove(os.path.join(folder, name))
+
+    labels = []
+    groups = {}
+    for result in results:
+        label = format_label(result['parameters'])
+        if label not in groups:
+            labels.append(label)
+            groups[label] = []
+        groups[label].append(result['curves'])
+
+    with open(folder.rstrip('/\\') + '.csv', 'w') as f:
+        f.write('percentage,infected_mean,infected_median,infected_max,infected_min,\
+fatalities_mean,fatalities_median,fatalities_max,fatalities_min\n')
+
+        for label in labels:
+            infected = [curves['infectious'] for curves in groups[label]]
+            fatalities = [curves['fatalities'] for curves in groups[label]]
+
+            np.save('%s/%s_infected.npy' %(folder, label), np.mean(zero_pad(infected), axis=0))
+            np.save('%s/%s_fatalities.npy' %(folder, label), np.mean(zero_pad(fatalities), axis=0))
+
+            #average over time per replica
+            infected = np.array([np.mean(curve) for curve in infected])
+            fatalities = np.array([np.mean(curve) for curve in fatalities])
+            f.write('%s,%f,%f,%f,%f,%f,%f,%f,%f\n' %(label, np.mean(infected), np.median(infected),
+                                                     np.max(infected), np.min(infected),
+                                                     np.mean(fatalities), np.median(fatalities),
+                                                     np.max(fatalities), np.min(fatalities)))
+
+
+def run_density_study(study, replicas=100, workers=None, seed=None, folder=None, config={},
+                      ensemble=False):
+    '''reruns one of the self-isolation studies in data/
+
+    Keyword arguments
+    -----------------
+    study : str
+        the study to run: 'high_density', 'medium_density' or 'low_density'
+
+    replicas : int
+        the number of runs per proportion of people that comply
+
+    workers : int
+        the number of worker processes, defaults to the number of processors
+
+    seed : int or SeedSequence
+        the seed to spawn the seeds of the runs from, fresh entropy if None
+
+    folder : str
+        the folder to write the results to, defaults to 'results/<study>'.
+        Pass 'data/<study>' to replace the results of the study in data/
+
+    config : dict
+        Configuration values to change from those of the study
+
+    ensemble : bool
+        whether to run the replicas of each proportion as one Ensemble
+    '''
+    if study not in density_studies:
+        raise ValueError('study %s not understood! Must be one of %s'
+                         %(study, ', '.join(density_studies)))
+
+    results = run_sweep({'self_isolate_proportion': isolation_proportions},
+                        dict(density_studies[study], **config), 'self_isolation',
+                        replicas, workers, seed, curves=True, ensemble=ensemble)
+
+    save_sweep(results, folder or os.path.join('results', study))
+    return results
+
+
+def _run_branch(sim, branch, seed, curves, sender):
+    '''runs a branch in a forked process and sends back its summary, see run_branches()'''
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            branch = dict(branch)
+            scenario = branch.pop('scenario', 'none')
+
+            #give the branch its own random stream, as all branches inherit the same state
+            sim.rng = get_rng(seed)
+            if numba_engine.use_numba(sim.Config.engine):
+                numba_engine.seed(sim.rng.integers(0, 2**31))
+
+            for key, value in branch.items():
+                sim.Config.set(key, value)
+            apply_scenario(sim, scenario, branch, reinitialise = False)
+
+            sim.run()
+
+        summary = sim.summary()
+        if curves:
+            summary['curves'] = {'infectious': np.asarray(sim.pop_tracker.infectious),
+                                 'fatalities': np.asarray(sim.pop_tracker.fatalities)}
+        sender.send(('done', summary))
+    except BaseException as error:
+        sender.send(('error', '%s: %s' %(type(error).__name__, error)))
+    finally:
+        sender.close()
+
+
+def run_branches(branches, config={}, scenario=None, warmup=51, replicas=1, workers=None,
+                 seed=None, curves=False):
+    '''runs scenarios branched from one shared warm-up, in parallel
+
+    Runs a single simulation up to frame 'warmup' (by default just past the
+    infection of patient zero at frame 50), and then runs every branch from
+    that state in a forked process. The forked processes share the memory of
+    the warmed up simulation copy-on-write, so it is not pickled or rerun
+    per branch. Requires the 'fork' start method, so is not available on
+    Windows.
+
+    Scenarios that change the roaming bounds or the speed do not reinitialise
+    the population, people move into the new bounds or to the new speed
+    over time. Set such bounds in config to have them in the warm-up as well.
+
+    Keyword arguments
+    -----------------
+    branches : list
+        per branch a dictionary of Configuration values to set, with the
+        scenario to set (see build_simulation()) under 'scenario'
+
+    config : dict
+        Configuration values of the warm-up, see build_simulation()
+
+    scenario : str
+        the scenario of the warm-up, see build_simulation()
+
+    warmup : int
+        the number of frames to run before branching
+
+    replicas : int
+        the number of runs per branch, each with its own random stream
+
+    workers : int
+        the maximum number of processes running at once, defaults to the
+        number of processors
+
+    seed : int or SeedSequence
+        the seed of the warm-up, and to spawn the seeds of the branches from
+
+    curves : bool
+        whether to add the number of infectious people and fatalities per
+        frame to the results, needed for save_sweep()
+
+    Returns
+    -------
+    results : list
+        per run the branch settings as 'parameters', the replica number and
+        the summary of the simulation
+    '''
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise RuntimeError('branching needs the fork start method, which this platform does not support')
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    warmup_seed, branch_seed = spawn_seeds(seed, 2)
+    sim = build_simulation(dict(config, seed=warmup_seed), scenario)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        sim.step_n(warmup - sim.frame)
+
+    runs = [(branch, replica) for branch in branches for replica in range(replicas)]
+    seeds = spawn_seeds(branch_seed, len(runs))
+
+    context = multiprocessing.get_context('fork')
+    pending = list(range(len(runs)))
+    running = {}
+    outcomes = [None] * len(runs)
+
+    while len(pending) > 0 or len(running) > 0:
+        #start branches while there are free workers
+        while len(pending) > 0 and len(running) < workers:
+            run = pending.pop(0)
+            receiver, sender = context.Pipe(duplex = False)
+            process = context.Process(target = _run_branch,
+                                      args = (sim, runs[run][0], seeds[run], curves, sender))
+            process.start()
+            sender.close()
+            running[receiver] = (run, process)
+
+        for receiver in multiprocessing.connection.wait(list(running)):
+            run, process = running.pop(receiver)
+            try:
+                outcomes[run] = receiver.recv()
+            except EOFError:
+                outcomes[run] = ('error', 'process exited with code %s' %process.exitcode)
+            receiver.close()
+            process.join()
+
+    results = []
+    for (branch, replica), (status, outcome) in zip(runs, outcomes):
+        if status == 'error':
+            raise RuntimeError('branch %s failed: %s' %(branch, outcome))
+        results.append(dict(parameters=branch, replica=replica, **outcome))
+
+    return results
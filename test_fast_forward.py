@@ -0,0 +1,49 @@
+'''
+tests that fast forwarding idle frames takes the same steps as tstep(),
+run with: python -m pytest
+'''
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from schedules import Travel_schedule
+from simulation import Simulation
+
+def make_simulation(scenario, fast_forward):
+    sim = Simulation(pop_size = 300, seed = 2, infection_range = 0.05, total_destinations = 2,
+                     simulation_steps = 1200, fast_forward = fast_forward, visualise = False,
+                     verbose = False, report_freq = 0)
+
+    if scenario in ('self_isolation', 'both'):
+        sim.Config.set_self_isolation()
+        sim.population_init()
+
+    if scenario in ('schedule', 'both'):
+        #legs to the isolation location as well, which the recovered are sent back from
+        sim.destinations[:,0:4] = [0.2, 0.2, 0.8, 0.8]
+        sim.schedule = Travel_schedule(day_length = 100)
+        members = np.arange(0, 300, 2)
+        sim.schedule.add_legs(members, 10, 2, wander_range = (0.05, 0.05))
+        sim.schedule.add_legs(members, 40, 1, wander_range = (0.05, 0.05))
+        sim.schedule.add_legs(members, 70, 0)
+
+    return sim
+
+
+@pytest.mark.parametrize('scenario', ['none', 'self_isolation', 'schedule', 'both'])
+def test_fast_forward_takes_same_steps(scenario):
+    runs = []
+    for fast_forward in [False, True]:
+        sim = make_simulation(scenario, fast_forward)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim.run()
+        runs.append(sim)
+
+    plain, forwarded = runs
+    assert forwarded.frame == plain.frame
+    assert np.array_equal(forwarded.population, plain.population)
+    assert forwarded.pop_tracker.infectious == plain.pop_tracker.infectious
+    assert forwarded.pop_tracker.recovered == plain.pop_tracker.recovered
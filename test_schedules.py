@@ -0,0 +1,79 @@
+'''
+tests of the daily travel schedules, run with: python -m pytest
+'''
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from locations import Location_registry
+from population import State_index
+from schedules import Travel_schedule
+from simulation import Simulation
+
+def make_population(pop_size=10):
+    '''returns a population of healthy members without a destination'''
+    population = np.zeros((pop_size, 15))
+    population[:,0] = np.arange(pop_size)
+    population[:,13:15] = 0.5
+    return population
+
+
+def test_leg_sets_wander_range_from_matrix_legs():
+    population = make_population()
+    destinations = np.zeros((10, 4))
+    schedule = Travel_schedule(day_length=10)
+    schedule.add_legs([1, 2], 3, 2, wander_range=(0.02, 0.04))
+    schedule.add_legs([3], 3, 1, wander_range=[[0.01, 0.03]])
+
+    schedule.apply(population, 3, destinations, State_index(population))
+
+    assert population[1, 11] == 2 and population[3, 11] == 1
+    assert np.array_equal(population[[1, 2, 3], 13], [0.02, 0.02, 0.01])
+    assert np.array_equal(population[[1, 2, 3], 14], [0.04, 0.04, 0.03])
+    #those without a leg keep their wander range
+    assert population[0, 13] == 0.5 and population[0, 14] == 0.5
+
+
+def test_leg_sets_wander_range_from_registry():
+    population = make_population()
+    registry = Location_registry(10, 2)
+    registry.assign([4, 5], [0.2, 0.2, 0.3, 0.4], 2)
+    schedule = Travel_schedule(day_length=10)
+    schedule.add_legs([4, 5], 7, 2)
+
+    schedule.apply(population, 17, registry, State_index(population))
+
+    assert np.allclose(population[[4, 5], 13], 0.05)
+    assert np.allclose(population[[4, 5], 14], 0.1)
+
+
+def test_matrix_leg_without_wander_range_raises():
+    population = make_population()
+    schedule = Travel_schedule(day_length=10)
+    schedule.add_legs([1], 0, 1)
+
+    with pytest.raises(ValueError):
+        schedule.apply(population, 0, np.zeros((10, 2)), State_index(population))
+
+
+def test_recovered_follow_schedule():
+    sim = Simulation(pop_size = 100, seed = 1, total_destinations = 2, visualise = False,
+                     verbose = False, report_freq = 0)
+    sim.Config.set_self_isolation()
+    sim.destinations[:,2:4] = 0.5
+    sim.schedule = Travel_schedule(day_length = 20)
+    sim.schedule.add_legs(np.arange(5, 100), 10, 2, wander_range = (0.05, 0.05))
+
+    #one recovered member, and one recovered member still in self isolation
+    sim.population[[3, 4], 6] = 2
+    sim.population[:,11][4] = 1
+    sim.schedule.add_legs([3], 10, 2, wander_range = (0.05, 0.05))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.step_n(12)
+
+    assert sim.population[3, 11] == 2
+    assert sim.population[4, 11] == 0
@@ -0,0 +1,37 @@
+'''
+tests of writing sweep results to disk, run with: python -m pytest
+'''
+
+import os
+
+import numpy as np
+
+from sweep import save_sweep
+
+def make_result(value):
+    '''returns a result of run_sweep() with curves for one parameter value'''
+    return {'parameters': {'self_isolate_proportion': value},
+            'curves': {'infectious': [1, 2, 3], 'fatalities': [0, 0, 1]}}
+
+
+def test_labels_have_one_format(tmp_path):
+    folder = str(tmp_path / 'sweep')
+    save_sweep([make_result(0), make_result(0.0), make_result(np.float32(0.5)),
+                make_result(0.50), make_result(0.9)], folder)
+
+    assert sorted(os.listdir(folder)) == ['0.0_fatalities.npy', '0.0_infected.npy',
+                                          '0.5_fatalities.npy', '0.5_infected.npy',
+                                          '0.9_fatalities.npy', '0.9_infected.npy']
+    with open(folder + '.csv') as f:
+        assert [line.split(',')[0] for line in f][1:] == ['0.0', '0.5', '0.9']
+
+
+def test_old_curves_are_removed(tmp_path):
+    folder = str(tmp_path / 'sweep')
+    save_sweep([make_result(0.25), make_result(0.75)], folder)
+    with open(os.path.join(folder, 'notes.txt'), 'w') as f:
+        f.write('kept')
+
+    save_sweep([make_result(0.75)], folder)
+
+    assert sorted(os.listdir(folder)) == ['0.75_fatalities.npy', '0.75_infected.npy', 'notes.txt']
@@ -3,8 +3,279 @@ collection of utility methods shared across files
 '''
 
 import os
+import signal
+
+import numpy as np
 
 def check_folder(folder='render/'):
     '''check if folder exists, make if not present'''
     if not os.path.exists(folder):
-            os.makedirs(folder)
\ No newline at end of file
+            os.makedirs(folder)
+
+
+def get_rng(seed=None):
+    '''returns the random number generator for a simulation
+
+    Returns a numpy Generator, seeded from seed. If seed is None, the global
+    numpy random state (np.random) is returned in stead, so that seeding with
+    np.random.seed() keeps working.
+
+    Keyword arguments
+    -----------------
+    seed : None, int or SeedSequence
+        the seed of the generator
+    '''
+    if seed is None:
+        return np.random
+    return np.random.default_rng(seed)
+
+
+def spawn_seeds(seed, n):
+    '''returns n independent child seeds of seed
+
+    Used to give each of a number of simulations (for example replicas run in
+    a process pool) its own random stream, that is reproducible from a single seed.
+
+    Keyword arguments
+    -----------------
+    seed : int or SeedSequence
+        the parent seed
+
+    n : int
+        the number of child seeds
+    '''
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n)
+
+
+def for_members(rng, members):
+    '''returns the generator to draw one value for each of members with
+
+    Returns rng itself, unless it is a Replica_streams, which then draws the
+    values of the members of every replica from the replica's own stream.
+
+    Keyword arguments
+    -----------------
+    rng : Generator or Replica_streams
+        the random number generator to use
+
+    members : ndarray
+        the indices of the members drawn for, or a boolean array marking them
+    '''
+    if isinstance(rng, Replica_streams):
+        return rng.select(members)
+    return rng
+
+
+class Replica_streams():
+    '''random number generator with a stream for every replica of an ensemble
+
+    The population of an ensemble holds replicas of replica_size members
+    one after the other (see ensemble.py). The values drawn for the members
+    of each replica come from the replica's own Generator, seeded with
+    the child seeds of seed (see spawn_seeds()), so the random numbers of
+    a replica do not depend on the other replicas.
+
+    Every draw needs values from each replica's Generator, which would cost
+    a Generator call per replica. In stead, every replica draws uniform and
+    standard normal values in blocks of block_size, and a draw gathers the
+    next values of the blocks of all replicas at once. Replicas that need
+    more than 1/16th of a block in a draw draw those values from their
+    Generator directly, as the call then costs little compared to drawing
+    the values. Only what a replica draws itself decides when its blocks
+    are refilled.
+
+    Has the methods of a Generator the simulation draws from: random(),
+    uniform() and normal(). A draw of a value for every member of all
+    replicas is split in blocks of replica_size. Other draws need the
+    members they draw for, set with for_members() right before the draw.
+    A single value (size None) is drawn for every replica, and returned
+    repeated for its members.
+
+    Keyword arguments
+    -----------------
+    seed : None, int or SeedSequence
+        the parent seed, if None it is drawn from the global numpy random
+        state, so that seeding with np.random.seed() keeps working
+
+    replicas : int
+        the number of replicas
+
+    replica_size : int
+        the number of members of each replica
+
+    block_size : int
+        the number of values of each kind drawn at once per replica, 0 to
+        call the Generators of the replicas for every draw
+    '''
+    def __init__(self, seed, replicas, replica_size, block_size=4096):
+        if seed is None:
+            seed = np.random.randint(0, 2**31)
+        self.seeds = spawn_seeds(seed, replicas)
+        self.streams = [np.random.default_rng(child) for child in self.seeds]
+        self.replicas = replicas
+        self.replica_size = replica_size
+        self.block_size = block_size
+        #draws of more values than this for a replica are drawn directly
+        self.direct_size = block_size // 16
+        self.members = None #members the next draw is for
+
+        #draw methods of every stream, per kind of value
+        self.methods = {'random': [stream.random for stream in self.streams],
+                        'normal': [stream.standard_normal for stream in self.streams]}
+
+        #blocks of drawn values per kind, and how many of each block are used
+        self.blocks = {kind: np.zeros((replicas, block_size)) for kind in self.methods}
+        self.used = {kind: np.full((replicas,), block_size) for kind in self.methods}
+        self.refills = 0
+
+        #number of values, replica and place in the blocks, of a draw for everyone
+        self.everyone = np.full((replicas,), replica_size)
+        self.replica_ids = np.arange(replicas)
+        self.everyone_owners = self.replica_ids.repeat(replica_size)
+        self.everyone_places = self.everyone_owners * block_size +\
+                               np.tile(np.arange(replica_size), replicas)
+
+    def select(self, members):
+        '''sets the members the next draw is for, returns self'''
+        members = np.asarray(members)
+        if members.dtype == bool:
+            members = np.flatnonzero(members)
+        self.members = members
+        return self
+
+    def take(self, kind, counts, owners=None, places=None):
+        '''returns counts[r] values of kind ('random' or 'normal') of every
+        replica r, in order of replica
+
+        Keyword arguments
+        -----------------
+        kind : str
+            'random' for uniform values in [0, 1), 'normal' for standard normal ones
+
+        counts : ndarray
+            the number of values for every replica
+
+        owners, places : ndarray
+            the replica of every value, and its position in the flattened
+            blocks if the blocks were unused, computed from counts if not given
+        '''
+        ends = counts.cumsum()
+        values = np.empty((int(ends[-1]),))
+        draws = self.methods[kind]
+
+        if self.block_size == 0:
+            for draw, start, end in zip(draws, (ends - counts).tolist(), ends.tolist()):
+                if end > start:
+                    values[start:end] = draw(end - start)
+            return values
+
+        blocks = self.blocks[kind]
+        used = self.used[kind]
+
+        direct = None
+        over = (used + counts > self.block_size) | (counts > self.direct_size)
+        if over.any():
+            #draw directly what is large compared to a block, refill the blocks that run out
+            direct = counts > self.direct_size
+            for r in np.flatnonzero(direct).tolist():
+                values[ends[r] - counts[r]:ends[r]] = draws[r](int(counts[r]))
+            for r in np.flatnonzero(over & ~direct).tolist():
+                blocks[r] = draws[r](self.block_size)
+                used[r] = 0
+                self.refills += 1
+            if direct.all():
+                return values
+
+        if owners is None:
+            owners = self.replica_ids.repeat(counts)
+            places = owners * self.block_size + np.arange(len(values)) - (ends - counts)[owners]
+
+        #gather from the blocks, as flat array
+        if direct is not None and direct.any():
+            served = ~direct[owners]
+            values[served] = blocks.ravel().take(places[served] + used[owners[served]])
+            used += np.where(direct, 0, counts)
+        else:
+            blocks.ravel().take(places + used[owners], out = values)
+            used += counts
+        return values
+
+    def draw(self, kind, size=None, out=None):
+        '''draws values of kind ('random' or 'normal'), see the class docstring'''
+        members = self.members
+        self.members = None
+
+        if size is None and out is None:
+            return np.repeat(self.take(kind, np.ones((self.replicas,), dtype=np.int64)),
+                             self.replica_size)
+
+        if out is not None:
+            n = len(out)
+        else:
+            n = size[0] if isinstance(size, tuple) else int(size)
+
+        order = None
+        if members is None:
+            if n != self.replicas * self.replica_size:
+                raise ValueError('can not split a draw of %i values over %i replicas of %i members, \
+set the members drawn for with for_members()' %(n, self.replicas, self.replica_size))
+            values = self.take(kind, self.everyone, self.everyone_owners, self.everyone_places)
+        else:
+            if len(members) != n:
+                raise ValueError('draw of %i values for %i members' %(n, len(members)))
+            owners = members // self.replica_size
+            if (owners[1:] < owners[:-1]).any():
+                #draw in order of replica, then put the values in order of the members
+                order = np.argsort(owners, kind = 'stable')
+            values = self.take(kind, np.bincount(owners, minlength = self.replicas))
+
+        if order is not None:
+            ordered = np.empty((n,))
+            ordered[order] = values
+            values = ordered
+
+        if out is not None:
+            out[:] = values
+            return out
+        return values
+
+    def random(self, size=None, out=None):
+        return self.draw('random', size, out)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.draw('random', size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale * self.draw('normal', size)
+
+
+class Interrupt_flag():
+    '''catches CTRL-C while active, so that a loop can stop at a safe point
+
+    Use as context manager around the loop, and check 'caught' where the
+    loop can stop. A second CTRL-C raises KeyboardInterrupt as usual.
+    Outside of the main thread, where signal handlers can not be set,
+    CTRL-C is not caught.
+    '''
+    def __init__(self):
+        self.caught = False
+        self.previous = None
+
+    def __enter__(self):
+        try:
+            self.previous = signal.signal(signal.SIGINT, self.handler)
+        except ValueError:
+            self.previous = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.previous is not None:
+            signal.signal(signal.SIGINT, self.previous)
+        return False
+
+    def handler(self, signum, frame):
+        if self.caught:
+            raise KeyboardInterrupt
+        self.caught = True
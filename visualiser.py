@@ -38,7 +38,7 @@ def build_fig(Config, figsize=(5,7)):
 
 
 def draw_tstep(Config, population, pop_tracker, frame,
-               fig, spec, ax1, ax2):
+               fig, spec, ax1, ax2, state_index=None):
     #construct plot and visualise
 
     #set plot style
@@ -60,16 +60,21 @@ def draw_tstep(Config, population, pop_tracker, frame,
                        addcross = False)
         
     #plot population segments
-    healthy = population[population[:,6] == 0][:,1:3]
+    def segment(state):
+        if state_index is None:
+            return population[population[:,6] == state][:,1:3]
+        return population[state_index.get(6, state), 1:3]
+
+    healthy = segment(0)
     ax1.scatter(healthy[:,0], healthy[:,1], color=palette[0], s = 2, label='healthy')
     
-    infected = population[population[:,6] == 1][:,1:3]
+    infected = segment(1)
     ax1.scatter(infected[:,0], infected[:,1], color=palette[1], s = 2, label='infected')
 
-    immune = population[population[:,6] == 2][:,1:3]
+    immune = segment(2)
     ax1.scatter(immune[:,0], immune[:,1], color=palette[2], s = 2, label='immune')
     
-    fatalities = population[population[:,6] == 3][:,1:3]
+    fatalities = segment(3)
     ax1.scatter(fatalities[:,0], fatalities[:,1], color=palette[3], s = 2, label='dead')
         
     